@@ -0,0 +1,77 @@
+# Compares agent collision handling with the uniform grid (Environment.collide) against the
+# original all-pairs loop that Environment.next used before.
+# Run from the repository root with: python -m bench.collisions [--sizes 100 1000 10000]
+import argparse
+from timeit import default_timer as timer
+
+import numpy as np
+
+from lib.env2d import Environment
+from lib.population2d import Population
+from lib.spatial2d import SpatialGrid
+
+# agent density of the benchmark arenas, in agents per default sized (1300x900) environment
+DENSITY = 500
+
+
+class Arena():
+    # the minimal part of an environment that the collision code needs
+    collide = Environment.collide
+
+    def __init__(self, n, seed=0):
+        rng = np.random.default_rng(seed)
+        self.size = np.array((1300, 900)) * np.sqrt(n / DENSITY)
+        self.population = Population(n)
+        self.collision_grid = SpatialGrid(self.size)
+        for i in range(n):
+            self.population.add()
+        self.population.pos[:n] = rng.uniform((0, 0), self.size, (n, 2))
+        self.population.vel[:n] = rng.normal(0, 1, (n, 2))
+        self.population.radius[:n] = 10
+
+
+def collide_all_pairs(arena):
+    # the all-pairs collision loop as it used to be in Environment.next
+    pop = arena.population
+    for i in range(pop.count):
+        for j in range(i + 1, pop.count):
+            pos_diff = pop.pos[i] - pop.pos[j]
+            d = np.linalg.norm(pos_diff)
+            if d <= pop.radius[i] + pop.radius[j]:
+                v1 = pop.vel[i].copy()
+                v2 = pop.vel[j].copy()
+                pop.vel[i] = v1 - np.dot(v1 - v2, pos_diff) / pow(d, 2) * pos_diff
+                pop.vel[j] = v2 - np.dot(v2 - v1, pos_diff) / pow(d, 2) * pos_diff
+
+
+def measure(function, arena, repeats):
+    # best time out of several repeats, in seconds
+    best = float("inf")
+    for r in range(repeats):
+        start = timer()
+        function(arena)
+        best = min(best, timer() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="agent collision benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--all-pairs-limit", type=int, default=10000,
+                        help="skip the all-pairs loop for more agents than this")
+    args = parser.parse_args()
+
+    print(f"{'agents':>8} {'grid [ms]':>12} {'all pairs [ms]':>16} {'speedup':>9}")
+    for n in args.sizes:
+        grid = measure(Arena.collide, Arena(n), args.repeats)
+        if n <= args.all_pairs_limit:
+            # the all-pairs loop is slow enough that a single run is representative
+            naive = measure(collide_all_pairs, Arena(n), 1 if n > 1000 else args.repeats)
+            print(f"{n:>8} {grid * 1e3:>12.3f} {naive * 1e3:>16.3f} {naive / grid:>9.1f}")
+        else:
+            print(f"{n:>8} {grid * 1e3:>12.3f} {'skipped':>16} {'':>9}")
+
+
+if __name__ == '__main__':
+    main()
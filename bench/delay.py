@@ -0,0 +1,60 @@
+# Spike delivery throughput of the DelayLine compared with the heapq event queue the network used
+# before, at several firing rates.
+# Run from the repository root with: python -m bench.delay [--neurons 1000] [--ticks 200]
+import argparse
+import heapq
+from timeit import default_timer as timer
+
+import numpy as np
+
+from lib.events import DelayLine
+
+
+def run_heap(spikes, delays):
+    # the heap as it was used by Neuron.spike and Network.next, one tuple per spike
+    queue = []
+    delivered = 0
+    for clock, fired in enumerate(spikes):
+        for i in fired:
+            heapq.heappush(queue, (clock + delays[i], (2, i)))
+        try:
+            while queue[0][0] == clock:
+                heapq.heappop(queue)
+                delivered += 1
+        except IndexError:
+            pass
+    return delivered
+
+
+def run_delay_line(spikes, delays):
+    line = DelayLine(int(delays.max()))
+    delivered = 0
+    for clock, fired in enumerate(spikes):
+        line.push(clock + delays[fired], fired, clock)
+        delivered += len(line.pop(clock))
+    return delivered
+
+
+def main():
+    parser = argparse.ArgumentParser(description="spike delivery benchmark")
+    parser.add_argument("--neurons", type=int, default=1000)
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--rates", type=float, nargs="+", default=[0.01, 0.1, 0.5])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    delays = rng.integers(1, 20, args.neurons)
+
+    print(f"{'rate':>6} {'spikes/tick':>12} {'heapq [ev/s]':>14} {'delay line [ev/s]':>18}")
+    for rate in args.rates:
+        spikes = [np.flatnonzero(rng.uniform(size=args.neurons) < rate) for t in range(args.ticks)]
+        results = []
+        for function in (run_heap, run_delay_line):
+            start = timer()
+            delivered = function(spikes, delays)
+            results.append(delivered / (timer() - start))
+        print(f"{rate:>6} {args.neurons * rate:>12.0f} {results[0]:>14.3g} {results[1]:>18.3g}")
+
+
+if __name__ == '__main__':
+    main()
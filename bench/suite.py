@@ -0,0 +1,239 @@
+# Benchmark suite for the hot paths of the simulation.
+# Every scenario is built from fixed seeds, so runs are repeatable. Results are written as json and
+# can be compared against a stored baseline to flag regressions.
+#
+# Run from the repository root:
+#   python -m bench.suite --out baseline.json                  record a baseline
+#   python -m bench.suite --compare baseline.json              flag regressions against it
+#   python -m bench.suite --only env_next --quick              a subset, with less repetitions
+import argparse
+import json
+import os
+import platform
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+
+from lib.agents2d import Agent2
+from lib.env2d import Environment
+from lib import neurons
+
+SEED = 1234
+
+
+def time_call(function, repeats, number=1):
+    # times function() number times per repeat, returns the per call times of all repeats
+    times = []
+    for r in range(repeats):
+        start = timer()
+        for i in range(number):
+            function()
+        times.append((timer() - start) / number)
+    return times
+
+
+def build_environment(agents, food, vision=False):
+    # keep the agent density of the default environment
+    size = (np.array((1300, 900)) * max(1.0, np.sqrt(agents / 10))).astype(int)
+    env = Environment(SEED, manual_agents=0, autonomous_agents=0, size=size, vision=vision)
+    env.max_food = food
+    for i in range(agents):
+        env.add_agent("autonomous")
+    env.spawn_food(food)
+    return env
+
+
+def build_network(neuron_count, fanout=10, rng=None):
+    # a network of LIF neurons with random connections, stepped on its own (not batched)
+    rng = rng or np.random.default_rng(SEED)
+    env = Environment(SEED, manual_agents=0, autonomous_agents=0)
+    agent = Agent2(np.array((100.0, 100.0)), env)
+    net = agent.network
+    grow_network(net, neuron_count, fanout, rng)
+    return env, net
+
+
+def grow_network(net, neuron_count, fanout, rng):
+    first = net.neuron_count[2]
+    for i in range(neuron_count):
+        net.add_neuron(neurons.Neuron_LIF(net))
+    n_out, n_in, n_inter = net.neuron_count[1], net.neuron_count[0], net.neuron_count[2]
+    for pre in range(first, first + neuron_count):
+        for post in rng.integers(0, n_inter, fanout):
+            net.connectome[n_out + post, n_in + pre] = rng.uniform(0.1, 0.5)
+    # connect some interneurons to the outputs
+    for out in range(n_out):
+        net.connectome[out, n_in + first + out] = 1
+
+
+def scenario_env_next(agents, food, ticks):
+    env = build_environment(agents, food)
+    env.step(10)
+    return time_call(env.next, repeats=5, number=ticks)
+
+
+def scenario_vision(agents, food, ticks):
+    # the ray casting of all agents, without the rest of the iteration
+    env = build_environment(agents, food, vision=True)
+    env.step(10)
+    clock = [env.internal_clock]
+
+    def see():
+        clock[0] += 1
+        env.vision.due(clock[0])
+
+    return time_call(see, repeats=5, number=ticks)
+
+
+def scenario_network_next(neuron_count, rate, ticks):
+    env, net = build_network(neuron_count)
+    rng = np.random.default_rng(SEED)
+    population = net.population
+
+    def step():
+        # drive the given fraction of neurons over threshold every iteration
+        env.internal_clock += 1
+        driven = rng.uniform(size=population.count) < rate
+        population.activation[:population.count][driven] = 1.0
+        net.next()
+
+    for i in range(20): step()
+    return time_call(step, repeats=5, number=ticks)
+
+
+def scenario_add_neuron(neuron_count):
+    def grow():
+        env = Environment(SEED, manual_agents=0, autonomous_agents=0)
+        agent = Agent2(np.array((100.0, 100.0)), env)
+        grow_network(agent.network, neuron_count, 10, np.random.default_rng(SEED))
+
+    return time_call(grow, repeats=3)
+
+
+def scenario_embedding_compute(neuron_count):
+    from lib.embedding import Embedding
+
+    env, net = build_network(neuron_count)
+
+    def compute():
+        embedding = Embedding(net)
+        embedding.compute()
+        embedding.close()  # stop collecting the topology changes of the network
+
+    return time_call(compute, repeats=3)
+
+
+def scenario_draw_spikes(neuron_count, frames):
+    # draws spikes onto an offscreen surface, no window is opened
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    import pygame
+    from lib.embedding import Embedding
+
+    env, net = build_network(neuron_count)
+    embedding = Embedding(net, pygame.Surface((500, 500)))
+    embedding.compute()
+    net.spike_tracking = True
+    rng = np.random.default_rng(SEED)
+    population = net.population
+
+    def frame():
+        env.internal_clock += 1
+        population.activation[:population.count][rng.uniform(size=population.count) < 0.05] = 1
+        net.next()
+        embedding.draw_spikes()
+
+    for i in range(20): frame()
+    times = time_call(frame, repeats=5, number=frames)
+    embedding.close()
+    return times
+
+
+def scenarios(quick=False):
+    # name -> function returning a list of timings in seconds
+    ticks = 20 if quick else 100
+    result = {}
+    for agents in (10, 100, 1000):
+        for food in (100, 1000):
+            result[f"env_next/agents={agents}/food={food}"] = \
+                lambda a=agents, f=food: scenario_env_next(a, f, ticks)
+    for agents in (10, 100, 1000):
+        result[f"vision/agents={agents}/food=100"] = \
+            lambda a=agents: scenario_vision(a, 100, ticks)
+    for neuron_count in (100, 1000, 10000):
+        for rate in (0.01, 0.1):
+            result[f"network_next/neurons={neuron_count}/rate={rate}"] = \
+                lambda n=neuron_count, r=rate: scenario_network_next(n, r, ticks)
+    for neuron_count in (100, 1000):
+        result[f"add_neuron/neurons={neuron_count}"] = \
+            lambda n=neuron_count: scenario_add_neuron(n)
+    for neuron_count in (10, 50):
+        result[f"embedding_compute/neurons={neuron_count}"] = \
+            lambda n=neuron_count: scenario_embedding_compute(n)
+        result[f"draw_spikes/neurons={neuron_count}"] = \
+            lambda n=neuron_count: scenario_draw_spikes(n, ticks)
+    return result
+
+
+def run(only=None, quick=False):
+    results = {}
+    for name, function in scenarios(quick).items():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        times = function()
+        results[name] = {"mean": float(np.mean(times)), "best": float(np.min(times)),
+                         "repeats": len(times)}
+        print(f"{name:<45} mean {results[name]['mean'] * 1e3:>10.3f} ms"
+              f"   best {results[name]['best'] * 1e3:>10.3f} ms", flush=True)
+    return {
+        "meta": {"python": sys.version.split()[0], "numpy": np.__version__,
+                 "platform": platform.platform(), "seed": SEED, "quick": quick},
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold):
+    # Prints the change of every scenario against the baseline. Returns the names of the scenarios
+    # that got slower by more than threshold (a fraction, 0.2 means 20 %)
+    regressions = []
+    print(f"\n{'scenario':<45} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        old, new = baseline["results"][name]["best"], result["best"]
+        change = new / old - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<45} {old * 1e3:>10.3f}ms {new * 1e3:>10.3f}ms {change:>+9.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="spyke benchmark suite")
+    parser.add_argument("--out", help="write the results to this json file")
+    parser.add_argument("--compare", help="baseline json file to compare the results against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="slowdown counted as a regression, as a fraction (default 0.2)")
+    parser.add_argument("--only", nargs="+", help="only run scenarios starting with these names")
+    parser.add_argument("--quick", action="store_true", help="less iterations per scenario")
+    args = parser.parse_args()
+
+    current = run(args.only, args.quick)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
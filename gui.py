@@ -1,16 +1,27 @@
+import os
+
 import pygame
 import pygame_gui
 
 from math import radians
 from threading import Thread
 
+import numpy as np
+
 from lib.env2d import Environment
+from lib.remote import RemoteEnvironment
 from lib.util2d import pol2cart
 from lib.embedding import Embedding
 
+# network snapshots written by the save buttons, see lib/snapshot.py
+SAVE_DIR = "saves"
+
 
 # Gui Window Module Classes
 class EnvControlWin(pygame_gui.elements.ui_window.UIWindow):
+    # target rates of the speed slider in ticks per second, the last step runs at max speed
+    speeds = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, None)
+
     def __init__(self, iface):
         # Static Variables
         self.iface = iface
@@ -78,8 +89,8 @@ class EnvControlWin(pygame_gui.elements.ui_window.UIWindow):
                 (self.dropdown_menu_width + 4 * iface.button_width + 6 * iface.padding,
                  iface.padding),
                 (self.speed_slider_width, iface.button_height)),
-            start_value=10,
-            value_range=(0, 100),
+            start_value=EnvControlWin.speeds.index(50),
+            value_range=(0, len(EnvControlWin.speeds) - 1),
             manager=iface.manager,
             container=self)
 
@@ -90,10 +101,15 @@ class EnvControlWin(pygame_gui.elements.ui_window.UIWindow):
                 # TODO add check of dropdown list which env is selected
 
             elif event.ui_element == self.load_button:
-                pass
+                # load the networks of all autonomous agents saved with the save button
+                if self.iface.env_win is None: return
+                env = self.iface.env_win.env
+                env.call(env.load_networks, os.path.join(SAVE_DIR, "env"))
 
             elif event.ui_element == self.save_button:
-                pass
+                if self.iface.env_win is None: return
+                env = self.iface.env_win.env
+                env.call(env.save_networks, os.path.join(SAVE_DIR, "env"))
 
             elif event.ui_element == self.start_button:
                 if self.start_button.text == "Start":
@@ -106,10 +122,8 @@ class EnvControlWin(pygame_gui.elements.ui_window.UIWindow):
                     self.iface.env_win.env_thread = Thread(target=self.iface.env_win.env.run)
 
         elif event.user_type == pygame_gui.UI_HORIZONTAL_SLIDER_MOVED:
-            self.iface.env_win.env.target_freq = (
-                1
-                + ((self.iface.env_win.env.iter_freq - 1) / 100)
-                * event.value)
+            if self.iface.env_win is None: return
+            self.iface.env_win.env.target_freq = EnvControlWin.speeds[int(event.value)]
 
 
 class MessageWin(pygame_gui.elements.ui_window.UIWindow):
@@ -127,6 +141,10 @@ class MessageWin(pygame_gui.elements.ui_window.UIWindow):
 class DisplayWin(pygame_gui.elements.ui_window.UIWindow):
     # Parent class of windows that display a dinamically changing surface
     # Not meant to be instantiated on its own
+    # windows that render straight onto scaled_surface at display size set this, then nothing
+    # needs to be scaled
+    draws_scaled = False
+
     def __init__(self, size, pos, surface_size, iface, title):
         self.iface = iface
         self.size = size
@@ -140,7 +158,7 @@ class DisplayWin(pygame_gui.elements.ui_window.UIWindow):
             resizable=True)
 
         # display surface size
-        self.container_size = surface_size
+        self.container_size = tuple(surface_size)
         self.surface_size = self.container_size
 
         # create a surface and stretch it into the window
@@ -167,35 +185,56 @@ class DisplayWin(pygame_gui.elements.ui_window.UIWindow):
                      'right': 'right'})
 
     def render(self):
-        # placeholder to be overriden by child classes
-        pass
-
-    def update(self, delta):
-        super().update(delta)
-
-        # Render displayed image onto surface
-        self.render()
-
-        # Get container dims and stretch the display surface into it, but keeping aspect ratio
-        self.container_size = self.get_container().get_size()
+        # placeholder to be overriden by child classes, returns whether the surface changed
+        return True
+
+    def resize(self):
+        # Get container dims and compute the size the display surface is stretched to, keeping its
+        # aspect ratio. Only done when the window size changed. Returns whether it changed
+        container_size = self.get_container().get_size()
+        if container_size == self.container_size and self.scaled_surface is not None:
+            return False
+        self.container_size = container_size
         cont_ratio = self.container_size[0] / self.container_size[1]
-        surf_ratio = self.surface_size[0] / self.surface_size[1]
+        surf_ratio = self.surface.get_width() / self.surface.get_height()
         if cont_ratio < surf_ratio:
             self.surface_size = (self.container_size[0], int(self.container_size[0] / surf_ratio))
         elif cont_ratio > surf_ratio:
             self.surface_size = (int(self.container_size[1] * surf_ratio), self.container_size[1])
         else:
             self.surface_size = self.container_size
+        self.scaled_surface = pygame.Surface(self.surface_size)
+        # the image element gets the same size, so it does not scale the image a second time
+        self.display.set_dimensions(self.surface_size)
+        return True
 
-        self.scaled_surface = pygame.transform.smoothscale(self.surface, self.surface_size)
-        self.display.set_image(self.scaled_surface)
+    def update(self, delta):
+        super().update(delta)
+        resized = self.resize()
+
+        # Render displayed image onto surface, and stretch it into the window if it changed
+        if self.render() or resized:
+            if not self.draws_scaled:
+                pygame.transform.smoothscale(self.surface, self.surface_size, self.scaled_surface)
+            self.display.set_image(self.scaled_surface)
 
 
 class EnvWin(DisplayWin):
+    draws_scaled = True
+    background_color = (32, 38, 36)
+    heading_quanta = 64  # number of pre-rendered headings of the agent sprites
+
     def __init__(self, iface):
         self.iface = iface
         # Create environment model object  # TODO add ability to load one from memory
-        self.env = Environment()
+        # In process mode the simulation runs in a child process (see lib/remote.py). Its agents
+        # can be steered and selected, but their networks cannot be inspected from here
+        self.remote = iface.process
+        self.env = RemoteEnvironment() if self.remote else Environment()
+        slider = iface.env_control_win.speed_slider
+        self.env.target_freq = EnvControlWin.speeds[int(slider.get_current_value())]
+        # the simulation thread publishes a frame after every tick, only that is drawn
+        self.env.publish()
         self.env_thread = Thread(target=self.env.run)
 
         self.selected_agent = None
@@ -207,32 +246,127 @@ class EnvWin(DisplayWin):
         self.pos = (0, iface.env_control_win.size[1])
 
         # Initialize display window (parent class)
+        self.target = None  # surface the layers below were built for
         super().__init__(self.size, self.pos, self.env.size, iface, "Environment")
 
     def render(self):
-        # reset window to background color
-        self.surface.fill((32, 38, 36))
-
-        # Draw Agents
-        for a in self.env.agents:
-            pygame.draw.circle(self.surface, a.color, a.pos, a.radius)
-            # triangle
-            A = pol2cart(7, a.angle) + a.pos
-            B = pol2cart(7, a.angle + radians(150)) + a.pos
-            C = pol2cart(7, a.angle + radians(210)) + a.pos
-            pygame.draw.polygon(self.surface, "black", (A, B, C))
+        # The environment is drawn at display size straight onto scaled_surface. Food is kept on
+        # a background layer that is updated incrementally, agents are blitted from pre-rendered
+        # sprites and only the areas of agents that moved are redrawn.
+        # Everything is read from the last frame the simulation published, never from the live
+        # environment, which the simulation thread may be changing meanwhile
+        frame = self.env.frame
+        if self.target is not self.scaled_surface:
+            self.reset_layers()
+        elif frame is self.drawn_frame and self.selected_agent == self.drawn_selection:
+            return False
+        self.drawn_frame = frame
+        scale = self.scale
+        surface, background = self.target, self.background
+        dirty = self.update_food(frame)
+
+        # agents in display coordinates, the sprite of every agent is chosen by its heading
+        n = len(frame)
+        pos = np.rint(frame.pos * scale).astype(int)
+        quantum = np.rint(frame.angle / (2 * np.pi) * EnvWin.heading_quanta).astype(int)
+        quantum %= EnvWin.heading_quanta
+        state = np.column_stack((pos, quantum))
+        moved = np.ones(n, dtype=bool)
+        if len(self.agent_state) == n:
+            moved = (state != self.agent_state).any(axis=1)
+        if self.selected_agent != self.drawn_selection:
+            for i in (self.selected_agent, self.drawn_selection):
+                if i is not None and i < n: moved[i] = True
+        if not moved.any() and not dirty:
+            return False
+
+        # restore the background where moved agents were and where food changed
+        dirty += [self.agent_rects[i] for i in np.nonzero(moved[:len(self.agent_rects)])[0]]
+        surface.blits([(background, rect, rect) for rect in dirty], doreturn=False)
+
+        # and draw all agents on top, in a single call
+        blits, rects = [], []
+        colors = frame.color.tolist()
+        for i in range(n):
+            sprite = self.sprite(tuple(colors[i]), frame.radius[i], quantum[i],
+                                 i == self.selected_agent)
+            rect = sprite.get_rect(center=pos[i])
+            blits.append((sprite, rect))
+            rects.append(rect)
+        surface.blits(blits, doreturn=False)
+        self.agent_rects, self.agent_state = rects, state
+        self.drawn_selection = self.selected_agent
+        return True
+
+    def reset_layers(self):
+        # (re)build the layers for the current display size
+        self.target = self.scaled_surface
+        self.scale = self.scaled_surface.get_width() / self.env.size[0]
+        self.sprites = {}
+        self.background = pygame.Surface(self.target.get_size())
+        self.background.fill(EnvWin.background_color)
+        self.target.blit(self.background, (0, 0))
+        self.food_ids = np.zeros(0, dtype=np.int64)
+        self.food_drawn = np.zeros((0, 2))
+        self.agent_rects = []
+        self.agent_state = np.zeros((0, 3), dtype=int)
+        self.drawn_selection = None
+        self.drawn_frame = None
+
+    def food_rect(self, position, food_radius):
+        radius = max(1, food_radius * self.scale)
+        x, y = position * self.scale
+        return pygame.Rect(x - radius - 1, y - radius - 1, 2 * radius + 3, 2 * radius + 3)
+
+    def update_food(self, frame):
+        # Bring the food on the background layer up to date with the food of the frame. Food is
+        # tracked by its id, so only eaten and new food is drawn. Returns the changed areas
+        ids, positions = frame.food_ids, frame.food_pos
+        eaten = ~np.isin(self.food_ids, ids)
+        new = ~np.isin(ids, self.food_ids)
+        if not eaten.any() and not new.any():
+            return []
+
+        radius = max(1, frame.food_radius * self.scale)
+        dirty = [self.food_rect(p, frame.food_radius) for p in self.food_drawn[eaten]]
+        for rect in dirty:
+            self.background.fill(EnvWin.background_color, rect)
+        # food next to eaten food may have been partly erased, it is drawn again with the new food
+        redraw = new.copy()
+        if eaten.any():
+            for p in self.food_drawn[eaten]:
+                redraw |= np.abs(positions - p).max(axis=1) <= 2 * frame.food_radius + 1
+        for p in positions[redraw]:
+            dirty.append(pygame.draw.circle(self.background, "green", p * self.scale, radius))
+        # copied, the frames of a remote environment are views into memory it keeps writing to
+        self.food_ids, self.food_drawn = ids.copy(), positions.copy()
+        return dirty
+
+    def sprite(self, color, radius, quantum, selected):
+        # agent body with its heading triangle, rendered once per heading quantum
+        key = (color, radius, quantum, selected)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            scale = self.scale
+            size = int(2 * (radius + 4) * scale) + 2
+            center = np.array((size, size)) / 2
+            sprite = pygame.Surface((size, size), pygame.SRCALPHA)
+            pygame.draw.circle(sprite, color, center, radius * scale)
+            angle = quantum * 2 * np.pi / EnvWin.heading_quanta
+            A = pol2cart(7 * scale, angle) + center
+            B = pol2cart(7 * scale, angle + radians(150)) + center
+            C = pol2cart(7 * scale, angle + radians(210)) + center
+            pygame.draw.polygon(sprite, "black", (A, B, C))
 
             # highlight if agent selected
-            if self.selected_agent == a.id:
-                pygame.draw.circle(self.surface, "yellow", a.pos, a.radius + 3, 1)
-
-        # Draw food
-        for f in self.env.food_positions:
-            pygame.draw.circle(self.surface, "green", f, self.env.food_radius)
+            if selected:
+                pygame.draw.circle(sprite, "yellow", center, (radius + 3) * scale, 1)
+            sprite = self.sprites[key] = sprite
+        return sprite
 
     def kill(self):
         # TODO ask if save
-        self.iface.env_win.env.running = False
+        self.iface.env_win.env.close()
         self.iface.env_win = None
         self.iface.env_control_win.start_button.set_text("Start")
         super().kill()
@@ -268,6 +402,31 @@ class AgentWin(pygame_gui.elements.ui_window.UIWindow):
             manager=iface.manager,
             container=self)
 
+        self.load_button = pygame_gui.elements.ui_button.UIButton(
+            relative_rect=pygame.Rect(
+                (2 * iface.button_width + 3 * iface.padding, iface.padding),
+                (iface.button_width, iface.button_height)),
+            text="Load",
+            manager=iface.manager,
+            container=self)
+
+    def save_path(self):
+        return os.path.join(SAVE_DIR, "agent_" + str(self.agent.id) + ".net")
+
+    def handle(self, event):
+        if event.user_type == pygame_gui.UI_BUTTON_PRESSED:
+            if event.ui_element == self.show_button:
+                self.iface.open_net_win(self.agent)
+
+            # the network is changed by the simulation thread, so it is saved and loaded between
+            # two of its ticks
+            elif event.ui_element == self.save_button:
+                self.agent.env.call(self.agent.network.save_network, self.save_path())
+
+            elif event.ui_element == self.load_button:
+                if os.path.isdir(self.save_path()):
+                    self.agent.env.call(self.agent.network.load_network, self.save_path())
+
 
 class NetWin(DisplayWin):
     surface_size = (500, 500)
@@ -285,6 +444,8 @@ class NetWin(DisplayWin):
         self.embedding = Embedding(agent.network, self.surface)
         self.embedding.compute()
         self.embedding.draw()
+        # version of the embedding's topology layer on self.surface, None forces a full copy
+        self.shown_topology = None
 
         # Spikes button
         self.spike_tracking = False
@@ -304,13 +465,27 @@ class NetWin(DisplayWin):
 
     def kill(self):
         self.iface.net_win = None
+        self.embedding.close()
         super().kill()
 
     def render(self):
-        self.surface = self.embedding.surface.copy()
+        # follow the growth of the network, only the changed parts of the embedding are recomputed
+        if self.embedding.update():
+            self.embedding.draw_changes()
+        # the topology layer is only copied when it was redrawn
+        changed = False
+        if self.shown_topology != self.embedding.topology_version:
+            self.surface.blit(self.embedding.surface, (0, 0))
+            self.shown_topology = self.embedding.topology_version
+            changed = True
+        # then only the areas where spikes were or are drawn are composed again
         if self.spike_tracking:
             self.embedding.draw_spikes()
-            self.surface.blit(self.embedding.spike_vis_overlay, (0, 0))
+            for rect in self.embedding.dirty_rects:
+                self.surface.blit(self.embedding.surface, rect, rect)
+                self.surface.blit(self.embedding.spike_vis_overlay, rect, rect)
+            changed = changed or bool(self.embedding.dirty_rects)
+        return changed
 
     def toggle_spikes(self):
         if not self.spike_tracking:
@@ -321,6 +496,7 @@ class NetWin(DisplayWin):
         else:
             self.spike_tracking = False
             self.agent.network.spike_tracking = False
+            self.shown_topology = None  # remove the last spikes from the display
             self.spikes_button.colours["normal_bg"] = self.ui_theme.get_colour_or_gradient(
                 'normal_bg',
                 self.combined_element_ids)
@@ -328,6 +504,8 @@ class NetWin(DisplayWin):
 
 
 class StatsWin(pygame_gui.elements.ui_window.UIWindow):
+    refresh_period = 0.5  # seconds between updates of the displayed numbers
+
     def __init__(self, iface):
         self.iface = iface
         self.pos = (iface.message_win.size[0],
@@ -338,6 +516,50 @@ class StatsWin(pygame_gui.elements.ui_window.UIWindow):
             manager=iface.manager,
             window_display_title="Stats")
 
+        # Gui elements
+        self.profile_button = pygame_gui.elements.ui_button.UIButton(
+            relative_rect=pygame.Rect((0, 0), (iface.button_width, iface.button_height)),
+            text="Profile",
+            manager=iface.manager,
+            container=self)
+
+        self.text_box = pygame_gui.elements.ui_text_box.UITextBox(
+            html_text="",
+            relative_rect=pygame.Rect(
+                (iface.button_width, 0),
+                (self.get_container().get_size()[0] - iface.button_width,
+                 self.get_container().get_size()[1])),
+            manager=iface.manager,
+            container=self)
+        self.since_refresh = 0
+
+    def handle(self, event):
+        if event.user_type == pygame_gui.UI_BUTTON_PRESSED:
+            if event.ui_element == self.profile_button and self.iface.env_win:
+                # switch the per phase timing of the environment on or off
+                profiler = self.iface.env_win.env.profiler
+                profiler.enabled = not profiler.enabled
+                profiler.reset()
+
+    def update(self, delta):
+        super().update(delta)
+        self.since_refresh += delta
+        if self.since_refresh < StatsWin.refresh_period or not self.iface.env_win: return
+        self.since_refresh = 0
+
+        env = self.iface.env_win.env
+        target = "max" if env.target_freq is None else env.target_freq
+        lines = [f"iterations: {env.internal_clock}   rate: {env.iter_freq:.1f} / {target} Hz   "
+                 f"spikes: {env.spike_count}"]
+        if self.iface.net_win and self.iface.net_win.spike_tracking:
+            ring = self.iface.net_win.agent.network.recording
+            lines.append(f"spike view: lag {ring.lag}   dropped {ring.dropped}")
+        if env.profiler.enabled:
+            lines += env.profiler.report()
+        else:
+            lines.append("press Profile to time the phases of every iteration")
+        self.text_box.set_text("<br>".join(lines))
+
 
 class CommandWin(pygame_gui.elements.ui_window.UIWindow):
     def __init__(self, iface):
@@ -371,5 +593,6 @@ class CommandWin(pygame_gui.elements.ui_window.UIWindow):
             # t sets up the app for testing the current thing im testing
             self.iface.env_win = EnvWin(self.iface)
             self.iface.env_win.selected_agent = 1
+            if self.iface.env_win.remote: return
             self.iface.agent_win = AgentWin(self.iface, self.iface.env_win.selected_agent)
             self.iface.net_win = NetWin(self.iface, self.iface.agent_win.agent)
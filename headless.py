@@ -0,0 +1,6 @@
+# Command-line entry point for running an environment without the GUI, see lib/runner.py
+from lib.runner import main
+
+
+if __name__ == '__main__':
+    main()
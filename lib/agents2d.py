@@ -1,15 +1,37 @@
 import math
 import numpy as np
 
-from . import util2d as u2d
 from . import network
 
 
+def population_field(name):
+    # property that reads and writes an agent's entry in the environment population arrays
+    def fget(self):
+        return getattr(self.env.population, name)[self.id]
+
+    def fset(self, value):
+        getattr(self.env.population, name)[self.id] = value
+
+    return property(fget, fset)
+
+
 class Agent1():
+    # The physical state of the agent lives in env.population, the agent object is just a view
+    # into that storage. Physics of all agents is advanced at once by the environment
+    pos = population_field("pos")
+    vel = population_field("vel")
+    angle = population_field("angle")
+    force = population_field("force")
+    mass = population_field("mass")
+    friction = population_field("friction")
+    radius = population_field("radius")
+    food_eaten = population_field("food_eaten")
+    color = population_field("color")
+
     def __init__(self, position, env):
         self.type = "manual"
         self.env = env
-        self.id = self.env.agent_count
+        self.id = self.env.population.add()
         self.pos = position
 
         self.vel = np.zeros(2)
@@ -27,25 +49,6 @@ class Agent1():
 
         self.food_eaten = 0
 
-    def next(self):
-
-        # If force is applied, the body accelerates
-        if self.force > 0:
-            accX, accY = u2d.pol2cart(self.force / self.mass, self.angle)
-            self.vel += (accX, accY)
-
-        # If the body moves friction slows it down
-        if np.linalg.norm(self.vel) <= self.friction:
-            self.vel = np.zeros(2)
-        else:
-            self.vel = self.vel - self.vel / np.linalg.norm(self.vel) * self.friction
-
-        # Adjust the position according to speed
-        self.pos += self.vel
-
-        # force decays TODO make it possible for the force to be a float value
-        if self.force >= 1: self.force -= 1
-
     def move(self, force=1):
         self.force += force
 
@@ -65,9 +68,7 @@ class Agent2(Agent1):
         # Initialize network
         self.network = network.Network(self)
         self.network.load_network()
-
-    def next(self):
-        super().next()
-
-        # iterate the networks
-        self.network.next()
+        if env.vision is not None:
+            env.vision.attach(self.network)
+        # the environment steps the network, on its own until it is added to env.network_batch
+        env.solo_networks.append(self.network)
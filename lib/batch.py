@@ -0,0 +1,328 @@
+import numpy as np
+
+from .connectome import CompressedColumns
+from .events import DelayLine
+from .neurons import LIFPopulation
+
+
+# Environment level executor that advances the networks of all autonomous agents at once.
+#
+# The interneuron arrays of all networks are packed into one LIFPopulation, whose slices the
+# networks' own populations become views of, so single neurons can still be inspected. The
+# connectomes are stacked into one block-diagonal sparse matrix and all spikes travel through one
+# delay line. Rows and columns of the block matrix are the rows and columns of the individual
+# connectomes, one network after the other.
+# Every network gets a block with spare columns, rows and interneurons to grow into (see reserve).
+# When the topology of a network changes only its block is rebuilt before the next iteration, all
+# networks are only repacked when a network outgrew its block or a network was added.
+class NetworkBatch():
+    def __init__(self, env):
+        self.env = env
+        self.networks = []
+        self.dirty = True  # all networks have to be repacked
+        self.changed = set()  # indices of the networks whose blocks have to be rebuilt
+
+        self.population = LIFPopulation(0, env.event_driven)
+        self.line = DelayLine()
+        self.matrix = None
+        # events pushed while the batch is waiting to be repacked: (network, times, codes)
+        self.backlog = []
+        # which networks record their spikes
+        self.tracking = np.zeros(0, dtype=bool)
+
+    def add(self, network):
+        self.env.solo_networks.remove(network)
+        network.batch = self
+        network.batch_index = len(self.networks)
+        self.networks.append(network)
+        self.tracking = np.append(self.tracking, network.spike_tracking)
+        # from now on spikes of the network go through the shared delay line
+        times, codes = network.future_queue.pending(self.env.internal_clock)
+        network.future_queue = BatchedQueue(self, network)
+        network.subscribe(lambda *event: self.topology_changed(network, *event))
+        for source in self.env.input_sources:
+            source.invalidate()  # the inputs of the network move to the batch
+        self.invalidate()
+        self.push(network, times, codes, self.env.internal_clock)
+
+    def invalidate(self):
+        self.dirty = True
+
+    def topology_changed(self, network, *event):
+        # the block of the network is rebuilt, all networks are repacked if it does not fit anymore
+        k = network.batch_index
+        self.changed.add(k)
+        if not self.dirty and not self.fits(k):
+            self.invalidate()
+
+    @staticmethod
+    def reserve(count):
+        # size of a block part for count neurons, with room to grow by a quarter
+        return count + count // 4 + 4
+
+    def fits(self, k):
+        n_in, n_out, n_inter = self.networks[k].connectome.neuron_count
+        return n_in <= self.cap_in[k] and n_out == self.cap_out[k] and n_inter <= self.cap_inter[k]
+
+    def push(self, network, times, codes, now):
+        # schedule spikes of neurons of one network, codes as in its connectome
+        if self.dirty:
+            self.backlog.append((network, np.broadcast_to(times, np.shape(codes)), codes))
+            return
+        k = network.batch_index
+        codes = np.asarray(codes)
+        cols = self.col_off[k] + np.where(codes >= 0, codes + self.cap_in[k], -1 - codes)
+        self.line.push(times, cols, now)
+
+    def pending(self, network, now):
+        # pending events of one network as (times, codes)
+        times, codes = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        if self.matrix is not None:
+            # the delay line always holds events in the layout of the last packing
+            line_times, cols = self.line.pending(now)
+            mine = self.col_net[cols] == network.batch_index
+            times.append(line_times[mine])
+            codes.append(self.col_code[cols[mine]])
+        for net, backlog_times, backlog_codes in self.backlog:
+            if net is network:
+                times.append(backlog_times)
+                codes.append(backlog_codes)
+        return np.concatenate(times), np.concatenate(codes)
+
+    def clear_events(self, network):
+        # drop all pending events of one network
+        self.backlog = [event for event in self.backlog if event[0] is not network]
+        if self.matrix is not None:
+            times, cols = self.line.pending(self.env.internal_clock)
+            keep = self.col_net[cols] != network.batch_index
+            self.line = DelayLine(self.line.size - 1)
+            self.line.push(times[keep], cols[keep], self.env.internal_clock)
+
+    def locate(self, cols):
+        # network index and connectome code of columns of the block matrix
+        return self.col_net[cols], self.col_code[cols]
+
+    def pending_events(self):
+        # all pending events in terms of networks and codes, so they survive a new layout
+        events = list(self.backlog)
+        self.backlog = []
+        if self.matrix is not None:
+            times, cols = self.line.pending(self.env.internal_clock)
+            nets, codes = self.locate(cols)
+            for k in np.unique(nets):
+                events.append((self.networks[k], times[nets == k], codes[nets == k]))
+        return events
+
+    def reschedule(self, events):
+        # push the pending events in the current layout
+        self.dirty = False
+        self.changed = set()
+        self.line = DelayLine(self.line.size - 1)
+        for net, times, codes in events:
+            self.push(net, times, codes, self.env.internal_clock)
+
+    def pack(self):
+        networks = self.networks
+        events = self.pending_events()
+
+        # layout of the block matrix, with spare room in every block
+        counts = np.array([net.connectome.neuron_count for net in networks], dtype=np.int64)
+        counts = counts.reshape(-1, 3)
+        self.set_layout(self.reserve(counts[:, 0]), counts[:, 1], self.reserve(counts[:, 2]))
+
+        # one population for all interneurons, the network populations become views into it.
+        # Spare slots have an infinite threshold and never spike
+        self.population = LIFPopulation(int(self.cap_inter.sum()), self.env.event_driven)
+        self.population.count = self.population.capacity
+        for k in range(len(networks)):
+            self.place(k)
+
+        # block-diagonal connectome
+        blocks = [self.block(k) for k in range(len(networks))]
+        self.matrix = CompressedColumns(
+            (len(self.row_net), len(self.col_net)),
+            np.concatenate([b[0] for b in blocks] + [np.zeros(0, dtype=np.int64)]),
+            np.concatenate([b[1] for b in blocks] + [np.zeros(0, dtype=np.int64)]),
+            np.concatenate([b[2] for b in blocks] + [np.zeros(0)]))
+
+        self.growing = [neuron for net in networks for neuron in net.growing]
+        self.reschedule(events)
+
+    def restore(self, caps, population, matrix):
+        # Take over a population and block matrix with the given block sizes (cap_in, cap_out and
+        # cap_inter of every network), for example memory-mapped from a checkpoint. They are used
+        # as they are, without copying, and must match the networks (see lib/checkpoint.py)
+        events = self.pending_events()
+        self.set_layout(*caps)
+        self.population = population
+        for k in range(len(self.networks)):
+            self.attach(k)
+        self.matrix = matrix
+        self.growing = [neuron for net in self.networks for neuron in net.growing]
+        self.reschedule(events)
+
+    def set_layout(self, cap_in, cap_out, cap_inter):
+        networks = self.networks
+        self.cap_in, self.cap_out, self.cap_inter = cap_in, cap_out, cap_inter
+        self.n_cols = self.cap_in + self.cap_inter
+        n_rows = self.cap_out + self.cap_inter
+        self.col_off = np.cumsum(self.n_cols) - self.n_cols
+        self.row_off = np.cumsum(n_rows) - n_rows
+        self.inter_off = np.cumsum(self.cap_inter) - self.cap_inter
+        nets = np.arange(len(networks))
+
+        # local index of every column/row/interneuron within its network
+        def local(sizes, offsets):
+            return np.arange(sizes.sum()) - np.repeat(offsets, sizes)
+
+        self.col_net = np.repeat(nets, self.n_cols)
+        col_local = local(self.n_cols, self.col_off)
+        col_inputs = self.cap_in[self.col_net]
+        self.col_code = np.where(col_local >= col_inputs, col_local - col_inputs, -1 - col_local)
+
+        self.row_net = np.repeat(nets, n_rows)
+        row_local = local(n_rows, self.row_off)
+        row_outputs = self.cap_out[self.row_net]
+        # for rows of outputs the output index, for rows of interneurons their global index
+        self.row_output = np.where(row_local < row_outputs, row_local, -1)
+        self.row_inter = np.where(
+            row_local < row_outputs, -1,
+            self.inter_off[self.row_net] + row_local - row_outputs)
+
+        self.inter_net = np.repeat(nets, self.cap_inter)
+        self.agent_ids = np.array([net.agent.id for net in networks], dtype=np.int64)
+        self.inter_col = (self.col_off[self.inter_net] + self.cap_in[self.inter_net]
+                          + local(self.cap_inter, self.inter_off))
+
+    def place(self, k):
+        # copy the interneurons of network k into its slice of the population
+        population, own = self.population, self.networks[k].population
+        start, n, end = self.inter_off[k], own.count, self.inter_off[k] + self.cap_inter[k]
+        for name in LIFPopulation.arrays:
+            getattr(population, name)[start:start + n] = getattr(own, name)[:n]
+            getattr(population, name)[start + n:end] = 0
+        population.threshold[start + n:end] = np.inf
+        population.stamp[start + n:end] = -1
+        self.attach(k)
+
+    def attach(self, k):
+        # make the arrays of the population of network k views of its slice of the population
+        own = self.networks[k].population
+        start, end = self.inter_off[k], self.inter_off[k] + self.cap_inter[k]
+        for name in LIFPopulation.arrays:
+            setattr(own, name, getattr(self.population, name)[start:end])
+        own.capacity = int(self.cap_inter[k])
+        own.base, own.offset = self.population, int(start)
+
+    def block(self, k):
+        # synapses of network k as (rows, cols, weights) of the block matrix, sorted by column
+        connectome = self.networks[k].connectome
+        rows, cols, weights = connectome.to_coo()
+        n_in, n_out = connectome.neuron_count[:2]
+        cols = self.col_off[k] + np.where(cols < n_in, cols, cols - n_in + self.cap_in[k])
+        return rows + self.row_off[k], cols, weights
+
+    def repack(self, k):
+        # rebuild only the block of network k, after a topology change that fits into it
+        self.place(k)
+        if self.population.event_driven:
+            # copied neurons are checked in the next iteration, as if they were excited
+            start = self.inter_off[k]
+            touched = np.arange(start, start + self.networks[k].population.count)
+            self.population.decay(touched, self.env.internal_clock)
+            self.population.excited.append(touched)
+        start = self.col_off[k]
+        self.matrix.replace(start, start + self.n_cols[k], *self.block(k))
+        self.growing = [neuron for net in self.networks for neuron in net.growing]
+
+    def update(self):
+        # bring the population and the block matrix up to date with the networks
+        if self.dirty:
+            self.pack()
+        for k in sorted(self.changed):
+            self.repack(k)
+        self.changed = set()
+
+    def next(self):
+        prof = self.env.profiler
+        t = prof.start()
+        if self.dirty or self.changed:
+            self.update()
+            prof.stop("networks/pack", t)
+            t = prof.start()
+        clock = self.env.internal_clock
+
+        # first, the spikes of the inputs of all networks
+        for source in self.env.input_sources:
+            self.input_spikes(source, clock)
+        prof.stop("networks/inputs", t)
+        t = prof.start()
+
+        spikes = self.population.next(clock)
+        if len(spikes):
+            self.line.push(clock + self.population.axon_length[spikes],
+                           self.inter_col[spikes], clock)
+            nets = self.inter_net[spikes]
+            self.record_spikes(clock, nets, spikes - self.inter_off[nets])
+        for neuron in self.growing:
+            neuron.read_dna()
+        prof.stop("networks/neurons", t)
+        t = prof.start()
+
+        # Fetch all events for current iteration and send them through all connectomes at once
+        fired = self.line.pop(clock)
+        prof.count("spikes_delivered", len(fired))
+        if len(fired):
+            rows, values = self.matrix.propagate(fired)
+            excited = values != 0.0
+            rows, values = rows[excited], values[excited]
+
+            # scatter the results back to the output actions of the agents
+            inter = self.row_inter[rows]
+            for r in rows[inter < 0]:
+                self.networks[self.row_net[r]].outputs[self.row_output[r]].excite()
+            self.population.excite(inter[inter >= 0], values[inter >= 0])
+        prof.stop("networks/delivery", t)
+
+    def input_spikes(self, source, clock):
+        # spikes of the input neurons of the networks of this batch driven by a source,
+        # see lib/inputs.py
+        due = source.due(clock)
+        if len(due) == 0: return
+        nets = source.batch_index[source.network_index[due]]
+        mine = nets >= 0
+        if not mine.all():
+            due, nets = due[mine], nets[mine]
+            if len(due) == 0: return
+        inputs = source.input_index[due]
+        self.line.push(clock, self.col_off[nets] + inputs, clock)
+        self.record_spikes(clock, nets, -1 - inputs, source.counted)
+
+    def record_spikes(self, clock, nets, codes, counted=True):
+        # Network.record_spikes for the networks of the batch at once, nets are the indices of
+        # the networks of the spiking neurons and codes their codes in the network
+        if counted:
+            self.env.spike_count += len(codes)
+        if self.env.spike_log is not None:
+            self.env.spike_log.append(clock, self.agent_ids[nets], codes)
+        # Spike tracking
+        tracked = self.tracking[nets]
+        for k in np.unique(nets[tracked]):
+            self.networks[k].recording.push(clock, codes[tracked & (nets == k)])
+
+
+class BatchedQueue():
+    # Stands in for the delay line of a network stepped by a NetworkBatch,
+    # events are forwarded to the shared delay line of the batch
+    def __init__(self, batch, network):
+        self.batch = batch
+        self.network = network
+
+    def push(self, times, codes, now):
+        self.batch.push(self.network, times, np.atleast_1d(codes), now)
+
+    def pending(self, now):
+        return self.batch.pending(self.network, now)
+
+    def __len__(self):
+        return len(self.pending(self.batch.env.internal_clock)[0])
@@ -0,0 +1,193 @@
+import json
+import os
+
+import numpy as np
+
+from .connectome import CompressedColumns
+from .neurons import LIFPopulation
+from .population2d import Population
+from .snapshot import save_array, load_array
+
+# Checkpoints of whole environments.
+#
+# A checkpoint is a directory in the same format as the network snapshots (see lib/snapshot.py):
+#   env.json                     clock, settings, state of the random generator, agent types
+#   population/<field>.npy       physical state of the agents, see Population
+#   food/positions.npy, ids.npy  the food store
+#   networks/agent_<id>/         network snapshot of every autonomous agent
+#   inputs/random_times.npy,     spikes of the random input neurons drawn ahead, see RandomInputs
+#   random_neurons.npy
+#   batch/                       block sizes, block matrix and interneuron arrays of the
+#                                NetworkBatch stepping the autonomous agents, see save_batch
+#
+# Restored environments open the arrays memory-mapped and copy-on-write. All environments restored
+# from the same checkpoint, in this process or in others, share the pages of the arrays through the
+# page cache and only get private copies of the pages they write to. The NetworkBatch steps the
+# block matrix straight from the checkpoint, the synapses of the single networks are only read when
+# their topology changes. What every branch has on its own:
+#   - the Python objects of the agents and neurons, about 300 bytes per neuron
+#   - the arrays written every iteration: agent physics and the interneuron activations (and stamps
+#     when event driven), 8 to 16 bytes per interneuron
+#   - the blocks of networks whose topology changed, the block matrix is copied at the first change
+# For example a 58 MB checkpoint of 40 agents with 2000 interneurons and 40000 synapses each costs
+# about 30 MB per branch, nearly all of it Python objects, while the synapses are shared.
+
+FORMAT_VERSION = 1
+
+
+def save_environment(env, path):
+    os.makedirs(os.path.join(path, "population"), exist_ok=True)
+    os.makedirs(os.path.join(path, "food"), exist_ok=True)
+
+    pop = env.population
+    for name in Population.fields:
+        save_array(os.path.join(path, "population"), name, getattr(pop, name)[:pop.count])
+    save_array(os.path.join(path, "food"), "positions", env.food.active)
+    save_array(os.path.join(path, "food"), "ids", env.food.ids[:len(env.food)])
+
+    env.network_batch.update()
+    env.save_networks(os.path.join(path, "networks"))
+    save_batch(env.network_batch, os.path.join(path, "batch"))
+    # the random input spikes drawn ahead, a block_end of -1 means none are drawn
+    random = env.random_inputs
+    if random.block_end >= 0:
+        os.makedirs(os.path.join(path, "inputs"), exist_ok=True)
+        save_array(os.path.join(path, "inputs"), "random_times", random.times)
+        save_array(os.path.join(path, "inputs"), "random_neurons", random.spiking)
+
+    meta = {
+        "format": FORMAT_VERSION,
+        "size": env.size.tolist(),
+        "internal_clock": env.internal_clock,
+        "spike_count": env.spike_count,
+        "agent_types": [agent.type for agent in env.agents],
+        "food_spawn_rate": env.food_spawn_rate,
+        "max_food": env.max_food,
+        "food_radius": env.food_radius,
+        "food_next_id": env.food.next_id,
+        "target_freq": env.target_freq,
+        "event_driven": env.event_driven,
+        "vision": env.vision is not None,
+        "random_block_end": env.random_inputs.block_end,
+        "rng": env.rng.bit_generator.state,
+    }
+    with open(os.path.join(path, "env.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def load_environment(path, environment_class, seed=None):
+    # Restore an environment from a checkpoint. Without a seed the restored environment continues
+    # exactly like the saved one, with a seed its random generator is replaced, so branches of the
+    # same checkpoint diverge
+    with open(os.path.join(path, "env.json")) as f:
+        meta = json.load(f)
+    if meta["format"] != FORMAT_VERSION:
+        raise ValueError("unsupported environment checkpoint format " + str(meta["format"]))
+
+    env = environment_class(manual_agents=0, autonomous_agents=0, size=meta["size"],
+                            event_driven=meta.get("event_driven", False),
+                            vision=meta.get("vision", False))
+    env.internal_clock = meta["internal_clock"]
+    env.spike_count = meta["spike_count"]
+    env.food_spawn_rate = meta["food_spawn_rate"]
+    env.max_food = meta["max_food"]
+    env.food_radius = meta["food_radius"]
+    env.target_freq = meta["target_freq"]
+    if seed is None:
+        env.rng.bit_generator.state = meta["rng"]
+    else:
+        env.rng = np.random.default_rng(seed)
+
+    # agents first, their state is overwritten by the arrays below
+    positions = load_array(os.path.join(path, "population"), "pos")
+    for agent_type, position in zip(meta["agent_types"], positions):
+        env.add_agent(agent_type, np.array(position))
+    pop = env.population
+    for name in Population.fields:
+        setattr(pop, name, load_array(os.path.join(path, "population"), name))
+    pop.capacity = pop.count
+
+    env.load_networks(os.path.join(path, "networks"))
+    if os.path.isdir(os.path.join(path, "batch")):
+        load_batch(env.network_batch, os.path.join(path, "batch"))
+    if meta.get("random_block_end", -1) >= 0 and seed is None:
+        # with a new seed the random inputs are drawn anew, like all other randomness
+        random = env.random_inputs
+        random.rebuild()  # the neurons, in the same order as when the spikes were drawn
+        random.times = np.array(load_array(os.path.join(path, "inputs"), "random_times"))
+        random.spiking = np.array(load_array(os.path.join(path, "inputs"), "random_neurons"))
+        random.block_end = meta["random_block_end"]
+
+    food = env.food
+    food.positions = load_array(os.path.join(path, "food"), "positions")
+    food.ids = load_array(os.path.join(path, "food"), "ids")
+    food.count = food.capacity = len(food.positions)
+    food.next_id = meta["food_next_id"]
+    food.grid_dirty = True
+    return env
+
+
+def save_batch(batch, path):
+    # the packed NetworkBatch, so restored environments step it without packing (copying) again
+    os.makedirs(path, exist_ok=True)
+    for name in ("cap_in", "cap_out", "cap_inter"):
+        save_array(path, name, getattr(batch, name))
+    save_array(path, "indptr", batch.matrix.indptr)
+    save_array(path, "indices", batch.matrix.indices)
+    save_array(path, "data", batch.matrix.data)
+    for name in LIFPopulation.arrays:
+        save_array(path, name, getattr(batch.population, name))
+
+
+def load_batch(batch, path):
+    # called after the networks are loaded, the batch must step the same networks
+    caps = [np.array(load_array(path, name)) for name in ("cap_in", "cap_out", "cap_inter")]
+    if len(caps[0]) != len(batch.networks):
+        raise ValueError("the checkpointed batch does not match the agents")
+    population = LIFPopulation(0, batch.env.event_driven)
+    for name in LIFPopulation.arrays:
+        setattr(population, name, load_array(path, name))
+    population.count = population.capacity = len(population.activation)
+    shape = (int((caps[1] + caps[2]).sum()), int((caps[0] + caps[2]).sum()))
+    matrix = CompressedColumns.from_arrays(
+        shape, load_array(path, "indptr"), load_array(path, "indices"), load_array(path, "data"))
+    batch.restore(caps, population, matrix)
+
+
+def fork(path, n, environment_class, seed=None):
+    # n environments restored from the same checkpoint, they share all arrays until written.
+    # With a seed every branch gets its own random generator derived from it
+    if seed is None:
+        return [load_environment(path, environment_class) for i in range(n)]
+    children = np.random.SeedSequence(seed).spawn(n)
+    return [load_environment(path, environment_class, child) for child in children]
+
+
+class EnvironmentPool():
+    # Environments restored from a checkpoint ahead of time, for fast episode resets.
+    # acquire() hands out a ready environment, refill() restores replacements at a convenient time,
+    # for example while the episode is running or between episodes
+    def __init__(self, path, environment_class, size=4, seed=None):
+        self.path = path
+        self.environment_class = environment_class
+        self.size = size
+        self.seeds = np.random.SeedSequence(seed) if seed is not None else None
+        self.ready = []
+        self.refill()
+
+    def __len__(self):
+        return len(self.ready)
+
+    def restore(self):
+        seed = self.seeds.spawn(1)[0] if self.seeds is not None else None
+        return load_environment(self.path, self.environment_class, seed)
+
+    def refill(self):
+        while len(self.ready) < self.size:
+            self.ready.append(self.restore())
+
+    def acquire(self):
+        # a fresh environment in the checkpointed state, restored on the spot if the pool is empty
+        if self.ready:
+            return self.ready.pop()
+        return self.restore()
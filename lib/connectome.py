@@ -0,0 +1,260 @@
+import numpy as np
+
+
+# Sparse, growable connectome of a network.
+#
+# Seen from outside it behaves like the dense matrix W the network used to keep, where wij is the
+# synapse weight between the ith post-synaptic and jth pre-synaptic neuron. Rows are the output
+# neurons followed by the interneurons, columns are the input neurons followed by the interneurons.
+#
+# Internally neurons are referred to by codes that do not change when other neurons are added:
+# input and output neurons with index i have the code -1 - i, interneurons their index i
+# (see NeuronBase.code). Every pre-synaptic neuron keeps the list of its outgoing synapses, indexed
+# by post-synaptic code, so finding, adding and removing synapses is amortised O(1) and propagating
+# spikes only touches the neurons that fired.
+
+class Fanout():
+    # outgoing synapses of a single pre-synaptic neuron, as growable arrays
+    def __init__(self, capacity=4):
+        self.n = 0
+        self.post = np.zeros(capacity, dtype=np.int64)  # codes of the post-synaptic neurons
+        self.weight = np.zeros(capacity)
+        # slot of the synapse to every post-synaptic code, views build it when first needed
+        self.slots = {}
+
+    @staticmethod
+    def view(post, weight):
+        # fanout over existing arrays, for example slices of a memory-mapped snapshot.
+        # The arrays are only copied once synapses are appended
+        fanout = Fanout(0)
+        fanout.post, fanout.weight, fanout.n = post, weight, len(post)
+        fanout.slots = None
+        return fanout
+
+    def find(self, post):
+        # slot of the synapse to the post-synaptic code, None if there is none
+        if self.slots is None:
+            self.slots = {code: i for i, code in enumerate(self.post[:self.n].tolist())}
+        return self.slots.get(post)
+
+    def append(self, post, weight):
+        if self.n == len(self.post):
+            self.post = np.concatenate((self.post, np.zeros(max(self.n, 4), dtype=np.int64)))
+            self.weight = np.concatenate((self.weight, np.zeros(max(self.n, 4))))
+        if self.slots is not None:
+            self.slots[int(post)] = self.n
+        self.post[self.n] = post
+        self.weight[self.n] = weight
+        self.n += 1
+
+    def remove(self, i):
+        # swap-remove synapse i
+        self.find(self.post[i])  # makes sure the slots are indexed
+        self.n -= 1
+        del self.slots[int(self.post[i])]
+        if i != self.n:
+            self.slots[int(self.post[self.n])] = i
+        self.post[i] = self.post[self.n]
+        self.weight[i] = self.weight[self.n]
+
+
+class Connectome():
+    def __init__(self, inputs=0, outputs=0, interneurons=0):
+        self.neuron_count = [0, 0, 0]  # input, output and interneurons respectively
+        self.nnz = 0  # number of synapses
+
+        # outgoing synapses of the input neurons and of the interneurons
+        self.input_fanouts = []
+        self.inter_fanouts = []
+
+        # called whenever neurons or synapses change, with the event as arguments:
+        #   "neuron", type, code          a neuron was added
+        #   "synapse", post, pre, weight  a synapse was set, weight 0 if it was removed
+        self.on_change = None
+
+        # synapses loaded from a snapshot, in compressed column form (see from_arrays).
+        # Fanouts of neurons that have not been touched yet are None and read from here
+        self.base = None
+
+        for i in range(inputs): self.add_neuron("input")
+        for i in range(outputs): self.add_neuron("output")
+        for i in range(interneurons): self.add_neuron("inter")
+
+    @property
+    def shape(self):
+        return (self.neuron_count[1] + self.neuron_count[2],
+                self.neuron_count[0] + self.neuron_count[2])
+
+    def add_neuron(self, type):
+        if type == "input":
+            code = -1 - self.neuron_count[0]
+            self.neuron_count[0] += 1
+            self.input_fanouts.append(Fanout())
+        elif type == "output":
+            code = -1 - self.neuron_count[1]
+            self.neuron_count[1] += 1
+        elif type == "inter":
+            code = self.neuron_count[2]
+            self.neuron_count[2] += 1
+            self.inter_fanouts.append(Fanout())
+        else:
+            raise ValueError
+        self.changed("neuron", type, code)
+
+    def changed(self, *event):
+        if self.on_change is not None:
+            self.on_change(*event)
+
+    # conversions between matrix indices and neuron codes
+    def pre_code(self, col):
+        return col - self.neuron_count[0] if col >= self.neuron_count[0] else -1 - col
+
+    def post_code(self, row):
+        return row - self.neuron_count[1] if row >= self.neuron_count[1] else -1 - row
+
+    def pre_col(self, codes):
+        return np.where(codes >= 0, codes + self.neuron_count[0], -1 - codes)
+
+    def post_row(self, codes):
+        return np.where(codes >= 0, codes + self.neuron_count[1], -1 - codes)
+
+    @staticmethod
+    def from_arrays(neuron_count, indptr, post, weight):
+        # Build a connectome from compressed columns: the synapses of column j (inputs first, then
+        # interneurons) are post[indptr[j]:indptr[j + 1]] with weights weight[...], post as codes.
+        # The arrays are not read until the synapses of a neuron are needed, so memory-mapped
+        # arrays are paged in lazily
+        connectome = Connectome()
+        connectome.neuron_count = list(neuron_count)
+        connectome.input_fanouts = [None] * neuron_count[0]
+        connectome.inter_fanouts = [None] * neuron_count[2]
+        connectome.base = (neuron_count[0], indptr, post, weight)
+        connectome.nnz = int(indptr[-1])
+        return connectome
+
+    def fanout(self, pre):
+        # outgoing synapses of the pre-synaptic neuron with the given code
+        fanouts, i = (self.inter_fanouts, pre) if pre >= 0 else (self.input_fanouts, -1 - pre)
+        if fanouts[i] is None:
+            inputs, indptr, post, weight = self.base
+            col = inputs + i if pre >= 0 else i
+            start, end = indptr[col], indptr[col + 1]
+            fanouts[i] = Fanout.view(post[start:end], weight[start:end])
+        return fanouts[i]
+
+    def to_arrays(self):
+        # the synapses in compressed column form, see from_arrays
+        fanouts = [self.fanout(-1 - i) for i in range(self.neuron_count[0])]
+        fanouts += [self.fanout(i) for i in range(self.neuron_count[2])]
+        indptr = np.zeros(len(fanouts) + 1, dtype=np.int64)
+        np.cumsum([f.n for f in fanouts], out=indptr[1:])
+        post = np.concatenate([f.post[:f.n] for f in fanouts] + [np.zeros(0, dtype=np.int64)])
+        weight = np.concatenate([f.weight[:f.n] for f in fanouts] + [np.zeros(0)])
+        return indptr, post, weight
+
+    def check_index(self, key):
+        row, col = key
+        if not (0 <= row < self.shape[0] and 0 <= col < self.shape[1]):
+            raise IndexError(key)
+        return self.post_code(row), self.pre_code(col)
+
+    def __getitem__(self, key):
+        post, pre = self.check_index(key)
+        fanout = self.fanout(pre)
+        i = fanout.find(post)
+        return 0.0 if i is None else fanout.weight[i]
+
+    def __setitem__(self, key, weight):
+        post, pre = self.check_index(key)
+        fanout = self.fanout(pre)
+        i = fanout.find(post)
+        if i is None:
+            if weight == 0: return  # no synapse to remove, nothing changes
+            fanout.append(post, weight)
+            self.nnz += 1
+        elif weight == fanout.weight[i]:
+            return
+        elif weight != 0:
+            fanout.weight[i] = weight
+        else:
+            fanout.remove(i)
+            self.nnz -= 1
+        self.changed("synapse", post, pre, weight)
+
+    def propagate(self, pre_codes):
+        # Send spikes of the given pre-synaptic neurons through the connectome.
+        # Returns the codes of the excited post-synaptic neurons and the summed synapse weights
+        fanouts = [self.fanout(pre) for pre in pre_codes]
+        if not fanouts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        post = np.concatenate([f.post[:f.n] for f in fanouts])
+        weight = np.concatenate([f.weight[:f.n] for f in fanouts])
+        post, inverse = np.unique(post, return_inverse=True)
+        return post, np.bincount(inverse, weight, minlength=len(post))
+
+    def to_coo(self):
+        # All synapses as (rows, cols, weights) in matrix layout, sorted by column
+        cols = self.pre_col(np.concatenate((
+            -1 - np.arange(self.neuron_count[0], dtype=np.int64),
+            np.arange(self.neuron_count[2], dtype=np.int64))))
+        fanouts = [self.fanout(-1 - i) for i in range(self.neuron_count[0])]
+        fanouts += [self.fanout(i) for i in range(self.neuron_count[2])]
+        counts = np.array([f.n for f in fanouts], dtype=np.int64)
+        if counts.sum() == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        rows = self.post_row(np.concatenate([f.post[:f.n] for f in fanouts]))
+        weights = np.concatenate([f.weight[:f.n] for f in fanouts])
+        return rows, np.repeat(cols, counts), weights
+
+    def toarray(self):
+        dense = np.zeros(self.shape)
+        rows, cols, weights = self.to_coo()
+        dense[rows, cols] = weights
+        return dense
+
+    def __array__(self, dtype=None, copy=None):
+        return self.toarray() if dtype is None else self.toarray().astype(dtype)
+
+
+class CompressedColumns():
+    # Read only compressed sparse column matrix, used where many connectomes are stepped as one
+    # block-diagonal matrix (see lib/batch.py)
+    def __init__(self, shape, rows, cols, weights):
+        # rows, cols and weights of all nonzero entries, sorted by column
+        self.shape = shape
+        self.indices = np.asarray(rows, dtype=np.int64)
+        self.data = np.asarray(weights, dtype=float)
+        self.indptr = np.zeros(shape[1] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cols, minlength=shape[1]), out=self.indptr[1:])
+
+    @staticmethod
+    def from_arrays(shape, indptr, indices, data):
+        # matrix over existing compressed column arrays, for example memory-mapped ones
+        matrix = object.__new__(CompressedColumns)
+        matrix.shape, matrix.indptr, matrix.indices, matrix.data = shape, indptr, indices, data
+        return matrix
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    def replace(self, start, end, rows, cols, weights):
+        # replace all entries of the columns start to end (exclusive), cols sorted and in range
+        first, last = self.indptr[start], self.indptr[end]
+        self.indices = np.concatenate((self.indices[:first], rows, self.indices[last:]))
+        self.data = np.concatenate((self.data[:first], weights, self.data[last:]))
+        self.indptr[end + 1:] += len(rows) - (last - first)
+        counts = np.bincount(cols - start, minlength=end - start)
+        self.indptr[start + 1:end + 1] = first + np.cumsum(counts)
+
+    def propagate(self, cols):
+        # Send spikes of the given columns through the matrix, only their entries are read.
+        # Returns the excited rows and the summed weights
+        starts = self.indptr[cols]
+        counts = self.indptr[cols + 1] - starts
+        total = counts.sum()
+        if total == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        idx = np.arange(total) + np.repeat(starts - np.cumsum(counts) + counts, counts)
+        rows, inverse = np.unique(self.indices[idx], return_inverse=True)
+        return rows, np.bincount(inverse, self.data[idx], minlength=len(rows))
@@ -1,9 +1,14 @@
 import numpy as np
-import pygame
 import heapq
 
+# pygame is only needed for drawing, the layout can be computed without it
+try:
+    import pygame
+except ImportError:
+    pygame = None
+
 from . import network
-from .util2d import rotate, divide_line
+from .util2d import rotate, rotate_many, divide_line
 
 
 # Object that generates a 2D representation of a network
@@ -19,57 +24,96 @@ class Embedding():
     spike_radius = 3    # smaller circles represent spikes
     flash_duration = 5  # if a pointlike event occurs, its representation lasts this many frames
 
-    def __init__(self, net: network.Network, surface, type="line"):
+    def __init__(self, net: network.Network, surface=None, type="line", size=(500, 500)):
+        # without a surface only the layout is computed, nothing is drawn
         self.type = type
         self.network = net
-        self.surface = surface.copy()
-        self.size = surface.get_size()
+        self.surface = surface.copy() if surface is not None else None
+        self.size = surface.get_size() if surface is not None else size
         self.scale = 20
 
         self.input_positions = np.zeros((self.network.neuron_count[0], 2))
         self.output_positions = np.zeros((self.network.neuron_count[1], 2))
         self.neuron_positions = np.zeros((self.network.neuron_count[2], 2, 2))
         # (neuron_id, x/y coordinate, soma/hillock)
-        self.dendrite_count = np.count_nonzero(self.network.connectome)
+        self.dendrite_count = self.network.connectome.nnz
         self.dendrite_positions = np.zeros((self.dendrite_count, 2, 2))
         # (dendrite id, input/output end, x/y coordinate)
-        self.dendrite_lookup_dict = {}
-        # this is for easily finding dendrite ids based on neuron ids
-
-        # An extra transparent surface to draw spikes on a separate layer
-        self.spike_vis_overlay = pygame.Surface(self.size, pygame.SRCALPHA)
+        self.dendrite_pre = np.zeros(self.dendrite_count, dtype=np.int64)
+        self.dendrite_post = np.zeros(self.dendrite_count, dtype=np.int64)
+        # codes of the pre and post-synaptic neurons of every dendrite
+        self.dendrite_offsets = np.zeros(self.network.connectome.shape[1] + 1, dtype=np.int64)
+        # dendrite ids by pre-synaptic connectome column, see index_dendrites
+
+        # topology changes of the network not yet applied to the embedding, see update
+        self.pending = []
+        # whether the drawing has to be redone from scratch, otherwise the dendrites added since
+        # the last draw are drawn on top of it (see draw_changes)
+        self.stale = True
+        self.new_dendrites = []
+        self.network.subscribe(self.topology_changed)
+
+        # The drawing is kept in layers: self.cavity is the static background, self.surface the
+        # cavity with the neurons and dendrites on it, only redrawn when the topology changes (the
+        # version is incremented on every redraw), and a transparent overlay with the spikes.
+        # The overlay is reused, every frame only the areas of the last frame's spikes are cleared
+        self.topology_version = 0
+        self.spike_vis_overlay = None
+        if self.surface is not None:
+            self.spike_vis_overlay = pygame.Surface(self.size, pygame.SRCALPHA)
+        self.spike_rects = []  # areas of the overlay with spikes drawn in the last frame
+        self.dirty_rects = []  # areas of the overlay changed by the last frame
         # Storage heap for spike events in progress. The events are of the form:
         # [start of event, end of event, type: "d"endrite/"a"xon, dendrite id/neuron id]
         self.spikes_in_progress = []
         heapq.heapify(self.spikes_in_progress)
         self.spike_frame_num = 0  # to keep track of number of frames computed so far
+        # sequence number up to which spikes were read from the network's spike ring
+        self.spike_cursor = self.network.recording.written
+
+        self.compute_terminal_positions()
+
+        # the surface as given is the blank background, the cavity is drawn onto it
+        self.blank = self.surface
+        self.cavity = None
+        self.draw_cavity()
 
+    def compute_terminal_positions(self):
+        # the inputs and outputs are spread over the upper and lower half of a circle
         top = np.array((self.size[0] / 2, 0))
         center = np.array(self.size) / 2
 
-        # draw the inputs on the surface, while saving their positions:
+        # compute the positions of the inputs
+        self.input_positions = np.zeros((self.network.neuron_count[0], 2))
         arc = np.pi / (self.network.neuron_count[0] + 1)
         for i in range(self.network.neuron_count[0]):
             rot = -(i + 1) * arc - np.pi / 2
-            pos = rotate(top, rot) + center
+            self.input_positions[i] = rotate(top, rot) + center
+
+        # and outputs
+        self.output_positions = np.zeros((self.network.neuron_count[1], 2))
+        arc = np.pi / (self.network.neuron_count[1] + 1)
+        for i in range(self.network.neuron_count[1]):
+            rot = (i + 1) * arc - np.pi / 2
+            self.output_positions[i] = rotate(top, rot) + center
+
+    def draw_cavity(self):
+        if self.blank is None: return
+        self.surface = self.blank.copy()
+
+        # draw the inputs and outputs on the surface
+        for pos in self.input_positions:
             pygame.draw.circle(
                 self.surface,
                 Embedding.input_color,
                 pos,
                 Embedding.neuron_radius)
-            self.input_positions[i] = pos
-
-        # draw outputs
-        arc = np.pi / (self.network.neuron_count[1] + 1)
-        for i in range(self.network.neuron_count[1]):
-            rot = (i + 1) * arc - np.pi / 2
-            pos = rotate(top, rot) + center
+        for pos in self.output_positions:
             pygame.draw.circle(
                 self.surface,
                 Embedding.output_color,
                 pos,
                 Embedding.neuron_radius)
-            self.output_positions[i] = pos
 
         # brain cavity
         pygame.draw.circle(
@@ -83,6 +127,98 @@ class Embedding():
         # saved into an instance variable so it does not need to be drawn more than this one time
         self.cavity = self.surface.copy()
 
+    def close(self):
+        # stop following the topology of the network
+        self.network.unsubscribe(self.topology_changed)
+
+    def topology_changed(self, *event):
+        # collect the changes, they are applied all at once by the next update
+        self.pending.append(event)
+
+    def update(self):
+        # Apply the topology changes of the network since the last update, only the positions and
+        # dendrites they affect are recomputed. Returns whether anything changed
+        if not self.pending: return False
+        events, self.pending = self.pending, []
+        if any(event[0] == "reset" for event in events):
+            self.compute()
+            return True
+
+        types = {event[1] for event in events if event[0] == "neuron"}
+        if "input" in types or "output" in types:
+            self.compute_terminal_positions()
+            self.draw_cavity()
+        if "inter" in types:
+            self.compute_neuron_positions()
+
+        # final state of every synapse that was touched, in the order of the events
+        synapses = {}
+        for event in events:
+            if event[0] == "synapse":
+                synapses[event[1:3]] = event[3] != 0
+        post = np.array([key[0] for key in synapses], dtype=np.int64)
+        pre = np.array([key[1] for key in synapses], dtype=np.int64)
+        present = np.array(list(synapses.values()), dtype=bool)
+
+        if types:
+            # neurons moved, so all dendrites are placed and drawn again
+            touched = self.synapse_keys(pre, post)
+            drawn = self.synapse_keys(self.dendrite_pre, self.dendrite_post)
+            keep = ~np.isin(drawn, touched[~present])
+            added = present & ~np.isin(touched, drawn)
+            self.dendrite_pre = np.concatenate((self.dendrite_pre[keep], pre[added]))
+            self.dendrite_post = np.concatenate((self.dendrite_post[keep], post[added]))
+            self.dendrite_positions = self.dendrite_endpoints(self.dendrite_pre, self.dendrite_post)
+            self.index_dendrites()
+            self.stale = True
+            return True
+
+        # only synapses changed: the touched ones are looked up among the dendrites of their
+        # pre-synaptic neurons, removed dendrites are deleted and new ones are inserted after the
+        # other dendrites of their column
+        cols = self.network.connectome.pre_col(pre)
+        removed, removed_cols, added = [], [], []
+        for k in range(len(pre)):
+            start, end = self.dendrite_offsets[cols[k]], self.dendrite_offsets[cols[k] + 1]
+            found = np.nonzero(self.dendrite_post[start:end] == post[k])[0]
+            if len(found) and not present[k]:
+                removed.append(start + found[0])
+                removed_cols.append(cols[k])
+            elif not len(found) and present[k]:
+                added.append(k)
+        added = np.array(added, dtype=np.int64)
+        removed = np.array(removed, dtype=np.int64)
+        if len(added) == 0 and len(removed) == 0: return False
+
+        at = self.dendrite_offsets[cols[added] + 1]
+        positions = self.dendrite_endpoints(pre[added], post[added])
+        self.dendrite_pre = np.insert(self.dendrite_pre, at, pre[added])
+        self.dendrite_post = np.insert(self.dendrite_post, at, post[added])
+        self.dendrite_positions = np.insert(self.dendrite_positions, at, positions, axis=0)
+        if len(removed):
+            removed += np.searchsorted(np.sort(at), removed, side="right")
+            self.dendrite_pre = np.delete(self.dendrite_pre, removed)
+            self.dendrite_post = np.delete(self.dendrite_post, removed)
+            self.dendrite_positions = np.delete(self.dendrite_positions, removed, axis=0)
+        self.dendrite_count = len(self.dendrite_pre)
+
+        # the dendrites of the columns after a touched one move by the number added or removed
+        n_cols = len(self.dendrite_offsets) - 1
+        delta = (np.bincount(cols[added], minlength=n_cols)
+                 - np.bincount(np.array(removed_cols, dtype=np.int64), minlength=n_cols))
+        self.dendrite_offsets[1:] += np.cumsum(delta)
+
+        if len(removed):
+            self.stale = True  # lines under the removed ones have to be drawn again
+        elif self.blank is not None:
+            self.new_dendrites.append(positions)
+        return True
+
+    @staticmethod
+    def synapse_keys(pre, post):
+        # a single integer per (pre, post) pair of neuron codes
+        return (pre.astype(np.int64) << 32) + post
+
     @ staticmethod
     def shorten_synapse(pos1, pos2, side="output"):
         # shorten the synapse representation for aesthetic purposes
@@ -98,19 +234,19 @@ class Embedding():
             return pos1_new, pos2_new
 
     def compute_neuron_positions(self):
+        n = self.network.neuron_count[2]
+        self.neuron_positions = np.zeros((n, 2, 2))
         if self.type == "line":
             soma_positions = divide_line(
                 np.array((self.size[0] / 2 - 100, 0)),
                 np.array((self.size[0] / 2 - 100, self.size[1])),
-                self.network.neuron_count[2])
-            for i in range(self.network.neuron_count[2]):
-                self.neuron_positions[i, 0, 0] = soma_positions[i, 0]
-                self.neuron_positions[i, 1, 0] = soma_positions[i, 1]
-                displacement = np.array((self.network.interneurons[i].axon_length * self.scale, 0))
-                hillock_pos = soma_positions[i] + displacement
-                hillock_pos = rotate(hillock_pos, self.network.interneurons[i].axon_angle)
-                self.neuron_positions[i, 0, 1] = hillock_pos[0]
-                self.neuron_positions[i, 1, 1] = hillock_pos[1]
+                n)
+            population = self.network.population
+            displacement = np.zeros((n, 2))
+            displacement[:, 0] = population.axon_length[:n] * self.scale
+            angles = np.array([neuron.axon_angle for neuron in self.network.interneurons], float)
+            self.neuron_positions[:, :, 0] = soma_positions
+            self.neuron_positions[:, :, 1] = rotate_many(soma_positions + displacement, angles)
 
         else:
             pass
@@ -118,76 +254,62 @@ class Embedding():
             # but other topologies should be possible
 
     def compute_dendrite_positions(self):
-        # Computes all dendrite positions based on the connectome and neuron positions
-
-        dendrite_id = 0  # keep track, increment when dendrite computed
-
-        # TODO following for loops can be merged
-
-        # INPUT to OUTPUT dendrites:
-        for ip in range(self.network.neuron_count[0]):
-            for op in range(self.network.neuron_count[1]):
-                if self.network.connectome[op, ip]:
-                    pos1 = self.input_positions[ip, :]
-                    pos2 = self.output_positions[op, :]
-                    pos1, pos2 = Embedding.shorten_synapse(pos1, pos2, "both")
-                    self.dendrite_positions[dendrite_id, 0, :] = pos1
-                    self.dendrite_positions[dendrite_id, 1, :] = pos2
-                    if (0, ip) in self.dendrite_lookup_dict:
-                        self.dendrite_lookup_dict[(0, ip)].append(dendrite_id)
-                    else:
-                        self.dendrite_lookup_dict[(0, ip)] = [dendrite_id]
-                    dendrite_id += 1
-
-        # INPUT to INTERNEURON dendrites:
-        for ip in range(self.network.neuron_count[0]):
-            for inter in range(self.network.neuron_count[2]):
-                if self.network.connectome[inter + self.network.neuron_count[1], ip]:
-                    pos1 = self.input_positions[ip, :]
-                    pos2 = self.neuron_positions[inter, :, 0]
-                    pos1, pos2 = Embedding.shorten_synapse(pos1, pos2, "both")
-                    self.dendrite_positions[dendrite_id, 0, :] = pos1
-                    self.dendrite_positions[dendrite_id, 1, :] = pos2
-                    if (0, ip) in self.dendrite_lookup_dict:
-                        self.dendrite_lookup_dict[(0, ip)].append(dendrite_id)
-                    else:
-                        self.dendrite_lookup_dict[(0, ip)] = [dendrite_id]
-                    dendrite_id += 1
-
-        # INTERNEURON to OUTPUT dendrites:
-        for op in range(self.network.neuron_count[1]):
-            for inter in range(self.network.neuron_count[2]):
-                if self.network.connectome[op, inter + self.network.neuron_count[0]]:
-                    pos1 = self.neuron_positions[inter, :, 1]
-                    pos2 = self.output_positions[op, :]
-                    pos1, pos2 = Embedding.shorten_synapse(pos1, pos2, "output")
-                    self.dendrite_positions[dendrite_id, 0, :] = pos1
-                    self.dendrite_positions[dendrite_id, 1, :] = pos2
-                    if (2, inter) in self.dendrite_lookup_dict:
-                        self.dendrite_lookup_dict[(2, inter)].append(dendrite_id)
-                    else:
-                        self.dendrite_lookup_dict[(2, inter)] = [dendrite_id]
-                    dendrite_id += 1
-
-        # INTER-INTER dendrites:
-        for n1 in range(self.network.neuron_count[2]):
-            for n2 in range(self.network.neuron_count[2]):
-                if self.network.connectome[self.network.neuron_count[1] + n2,
-                                           self.network.neuron_count[0] + n1]:
-                    pos1 = self.neuron_positions[n1, :, 1]
-                    pos2 = self.neuron_positions[n2, :, 0]
-                    pos1, pos2 = Embedding.shorten_synapse(pos1, pos2, "output")
-                    self.dendrite_positions[dendrite_id, 0, :] = pos1
-                    self.dendrite_positions[dendrite_id, 1, :] = pos2
-                    if (2, n1) in self.dendrite_lookup_dict:
-                        self.dendrite_lookup_dict[(2, n1)].append(dendrite_id)
-                    else:
-                        self.dendrite_lookup_dict[(2, n1)] = [dendrite_id]
-                    dendrite_id += 1
+        # Computes all dendrite positions based on the connectome and neuron positions, all
+        # synapses at once
+        rows, cols, weights = self.network.connectome.to_coo()
+        n_in, n_out = self.network.neuron_count[0], self.network.neuron_count[1]
+        self.dendrite_pre = np.where(cols >= n_in, cols - n_in, -1 - cols)
+        self.dendrite_post = np.where(rows >= n_out, rows - n_out, -1 - rows)
+        self.dendrite_positions = self.dendrite_endpoints(self.dendrite_pre, self.dendrite_post)
+        self.index_dendrites()
+
+    def dendrite_endpoints(self, pre, post):
+        # positions of the dendrites between the neurons with the given codes, shape (n, 2, 2).
+        # The dendrites start at the input neurons or at the axon ends of the interneurons
+        # and end at the outputs or at the somas of the interneurons
+        from_input = pre < 0
+        start = np.zeros((len(pre), 2))
+        start[from_input] = self.input_positions[-1 - pre[from_input]]
+        start[~from_input] = self.neuron_positions[pre[~from_input], :, 1]
+        to_output = post < 0
+        end = np.zeros((len(post), 2))
+        end[to_output] = self.output_positions[-1 - post[to_output]]
+        end[~to_output] = self.neuron_positions[post[~to_output], :, 0]
+
+        # shorten the synapse representations, see shorten_synapse. Dendrites from inputs are
+        # shortened on both ends, the others only at the post-synaptic end
+        direction = end - start
+        length = np.linalg.norm(direction, axis=1, keepdims=True)
+        unit = direction / np.where(length > 0, length, 1)
+        positions = np.zeros((len(pre), 2, 2))
+        positions[:, 0] = start + Embedding.neuron_radius * unit * from_input[:, None]
+        positions[:, 1] = end - Embedding.neuron_radius * unit
+        return positions
+
+    def index_dendrites(self):
+        # Number the dendrites in the order of the connectome columns of their pre-synaptic
+        # neurons, so the dendrites of the neuron in column j are the ids
+        # dendrite_offsets[j]:dendrite_offsets[j + 1]
+        n_cols = self.network.connectome.shape[1]
+        cols = self.network.connectome.pre_col(self.dendrite_pre)
+        order = np.argsort(cols, kind="stable")
+        self.dendrite_pre, self.dendrite_post = self.dendrite_pre[order], self.dendrite_post[order]
+        self.dendrite_positions = self.dendrite_positions[order]
+        self.dendrite_count = len(order)
+        self.dendrite_offsets = np.zeros(n_cols + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cols, minlength=n_cols), out=self.dendrite_offsets[1:])
+
+    def dendrites_of(self, col):
+        # ids of the dendrites of the pre-synaptic neuron in connectome column col
+        return range(self.dendrite_offsets[col], self.dendrite_offsets[col + 1])
 
     def compute(self):
         # Compute or recompute the embedding.
         # This is a wrapper funcion for the subfunctions that compute the embedding together
+        self.pending = []
+        self.stale = True
+        self.compute_terminal_positions()
+        self.draw_cavity()
         self.compute_neuron_positions()
         self.compute_dendrite_positions()
 
@@ -214,7 +336,10 @@ class Embedding():
 
     def draw(self):
         # Draw the current state of the network embedding onto the surface
-        self.sufrace = self.cavity.copy()   # reset to background
+        self.surface = self.cavity.copy()   # reset to background
+        self.topology_version += 1
+        self.stale = False
+        self.new_dendrites = []
 
         # draw inter neurons
         for i, pos in zip(range(self.network.neuron_count[2]), self.neuron_positions):
@@ -229,21 +354,41 @@ class Embedding():
                 pos[1],
                 1)
 
+    def draw_changes(self):
+        # Bring the drawing up to date after update. Added dendrites are drawn on top of the
+        # surface, anything else is drawn again from scratch
+        if self.stale:
+            self.draw()
+            return
+        for positions in self.new_dendrites:
+            for pos in positions:
+                pygame.draw.line(
+                    self.surface,
+                    Embedding.dendrite_color,
+                    pos[0],
+                    pos[1],
+                    1)
+        self.new_dendrites = []
+        self.topology_version += 1
+
     def draw_spikes(self):
-        self.spike_vis_overlay = pygame.Surface(self.size, pygame.SRCALPHA)
+        # clear the spikes of the last frame, only where they were drawn
+        cleared, self.spike_rects = Embedding.merge_rects(self.spike_rects), []
+        for rect in cleared:
+            self.spike_vis_overlay.fill((0, 0, 0, 0), rect)
         self.spike_frame_num += 1
 
-        # every iteration, check the recording queue and register all spike events that happened
-        # then transform them into visualization events
+        # every iteration, take all spikes recorded since the last frame out of the network's
+        # spike ring at once and transform them into visualization events
         # the spike vis events will be stored in the heap self.spikes_in_progress in the format:
         # (frame number of event, type: dendrite - True/axon - False, dendrite/inter-neuron id)
         # for axon spikes there is a fourth element: internal clock time of spike
-        try:
-            spike = heapq.heappop(self.network.recording)
+        ticks, codes, self.spike_cursor = self.network.recording.read(self.spike_cursor)
+        for tick, code in zip(ticks.tolist(), codes.tolist()):
             # if spike is from input neuron
-            if spike[1].type == "input":
+            if code < 0:
                 # get ids of dendrites connecting to neuron
-                dendrites = self.dendrite_lookup_dict.get(spike[1].id, [])
+                dendrites = self.dendrites_of(-1 - code)
                 for dendrite_id in dendrites:
                     for i in range(Embedding.flash_duration):
                         heapq.heappush(self.spikes_in_progress,
@@ -252,10 +397,7 @@ class Embedding():
             # if event is from interneuron:
             else:
                 heapq.heappush(self.spikes_in_progress,
-                               (self.spike_frame_num, False, spike[1].id[1], spike[0]))
-
-        except IndexError:
-            pass
+                               (self.spike_frame_num, False, code, tick))
 
         # make note of the environment internal clock time
         env_time = self.network.agent.env.internal_clock
@@ -265,12 +407,12 @@ class Embedding():
             while self.spikes_in_progress[0][0] == self.spike_frame_num:
                 vis_event = heapq.heappop(self.spikes_in_progress)
                 if vis_event[1]:
-                    pygame.draw.line(
+                    self.spike_rects.append(pygame.draw.line(
                         self.spike_vis_overlay,
                         Embedding.spike_color,
                         self.dendrite_positions[vis_event[2], 0],
                         self.dendrite_positions[vis_event[2], 1],
-                        1)
+                        1))
                 else:
                     time = env_time - vis_event[3]
                     pos1 = self.neuron_positions[vis_event[2], :, 0]
@@ -278,11 +420,11 @@ class Embedding():
                     duration = self.network.interneurons[vis_event[2]].axon_length
                     pos = pos1 + (pos2 - pos1) * time / duration
                     if np.linalg.norm(pos - pos1) <= np.linalg.norm(pos2 - pos1):
-                        pygame.draw.circle(
+                        self.spike_rects.append(pygame.draw.circle(
                             self.spike_vis_overlay,
                             Embedding.spike_color,
                             pos,
-                            Embedding.spike_radius)
+                            Embedding.spike_radius))
 
                         heapq.heappush(self.spikes_in_progress,
                                        (self.spike_frame_num + 1,
@@ -291,7 +433,7 @@ class Embedding():
                                         vis_event[3]))
 
                     else:
-                        dendrites = self.dendrite_lookup_dict.get((2, vis_event[2]), [])
+                        dendrites = self.dendrites_of(self.network.neuron_count[0] + vis_event[2])
                         for dendrite_id in dendrites:
                             for i in range(Embedding.flash_duration):
                                 heapq.heappush(self.spikes_in_progress,
@@ -299,3 +441,15 @@ class Embedding():
 
         except IndexError:
             pass
+
+        self.dirty_rects = Embedding.merge_rects(cleared + self.spike_rects)
+
+    @staticmethod
+    def merge_rects(rects):
+        # Many spikes mean many overlapping rects, then filling or blitting their bounding rect once
+        # is cheaper than doing it rect by rect
+        if len(rects) < 2: return rects
+        union = rects[0].unionall(rects)
+        if sum(rect.w * rect.h for rect in rects) > union.w * union.h:
+            return [union]
+        return rects
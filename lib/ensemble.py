@@ -0,0 +1,67 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from .runner import run_headless
+
+
+# Runs many independent environments in parallel on a pool of worker processes.
+# The workers are started once and reused for all runs submitted to the ensemble, so the cost of
+# starting a process and importing spyke is only paid once per worker.
+
+def warm_up():
+    # executed once in every worker when it starts
+    from . import env2d  # noqa: F401
+
+
+def run_one(index, settings):
+    # executed in a worker, runs a single environment
+    metrics = run_headless(**settings)
+    metrics["run"] = index
+    metrics["worker"] = os.getpid()
+    return metrics
+
+
+def spawn_seeds(seed, n):
+    # n independent seeds for the runs of an ensemble, derived from one seed
+    return [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(n)]
+
+
+class Ensemble():
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_up)
+        self.submitted = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown()
+
+    def submit(self, **settings):
+        # Submit a single run, the settings are the arguments of runner.run_headless.
+        # Returns a future of the run metrics
+        future = self.executor.submit(run_one, self.submitted, settings)
+        self.submitted += 1
+        return future
+
+    def run(self, runs):
+        # Run a list of settings, one per environment, and yield the metrics of every run as soon
+        # as it finishes
+        futures = [self.submit(**settings) for settings in runs]
+        for future in as_completed(futures):
+            yield future.result()
+
+    def sweep(self, n, seed=None, **settings):
+        # n runs with the same settings and different seeds
+        return self.run([dict(settings, seed=s) for s in spawn_seeds(seed, n)])
+
+    def fork(self, checkpoint, n, seed=None, **settings):
+        # n branches of the same checkpoint, each continued with its own random generator.
+        # The workers map the checkpoint arrays copy-on-write, so the branches share their pages
+        return self.sweep(n, seed, checkpoint=checkpoint, **settings)
@@ -1,103 +1,291 @@
 from .agents2d import Agent1, Agent2
-import random
+from .population2d import Population
+from .spatial2d import SpatialGrid
+from .food2d import FoodStore
+from .batch import NetworkBatch
+from .profiler import Profiler
+from .spikelog import SpikeLog
+from .frame import Frame
+from .inputs import RandomInputs
+from .vision import Vision
+from .scheduler import Scheduler
+from . import checkpoint
 import numpy as np
+import os
+import threading
 from timeit import default_timer as timer
-import time
 
 
 class Environment():
-    def __init__(self):
-        self.size = np.array((1300, 900))
+    def __init__(self, seed=None, manual_agents=1, autonomous_agents=10, size=(1300, 900),
+                 event_driven=False, vision=False):
+        self.size = np.array(size)
+        # step the interneurons event driven, only touching excited ones (see LIFPopulation)
+        self.event_driven = event_driven
+        # all randomness of the environment comes from this generator, so seeded runs repeat
+        self.rng = np.random.default_rng(seed)
         self.running = False
-        self.iter_freq = 1
-        self.target_freq = 50
+        # functions waiting to run between two ticks of run(), see call. The lock is held by run()
+        # while it ticks
+        self.commands = []
+        self.lock = threading.Lock()
+        # paces run(), see lib/scheduler.py
+        self.scheduler = Scheduler()
         self.agents = []
         self.agent_count = 0
+        # physical state of all agents, stored as arrays
+        self.population = Population()
+        # spatial index used to find colliding agents
+        self.collision_grid = SpatialGrid(self.size)
+        # networks of all autonomous agents are stepped together
+        self.network_batch = NetworkBatch(self)
+        # networks of agents created without add_agent, stepped one by one
+        self.solo_networks = []
+        # spikes of all random input neurons, drawn ahead in blocks (see lib/inputs.py)
+        self.random_inputs = RandomInputs(self)
+        # ray-cast vision of the autonomous agents if enabled, None otherwise (see lib/vision.py)
+        self.vision = Vision(self) if vision else None
+        self.input_sources = (self.random_inputs,) + ((self.vision,) if vision else ())
         self.internal_clock = 0
+        self.spike_count = 0  # spikes of all neurons of all agents so far
+        # when recording, the spikes of all agents are appended to this log (see lib/spikelog.py)
+        self.spike_log = None
+        # times the phases of every iteration when enabled
+        self.profiler = Profiler()
+        # the state at the end of the last tick for readers on other threads, see publish
+        self.frame = None
+        self.publishing = False
 
         # food
         self.food_spawn_rate = 100  # food spawns every this many iterations on average
         self.max_food = 100
-        self.food_positions = []
         self.food_radius = 3
+        self.food = FoodStore(self.size, self.max_food, self.food_radius)
 
         # Initialize environment TODO this initial state is only for testing
-        self.add_agent("manual", np.array(self.size) / 2)
-        for i in range(10):
+        for i in range(manual_agents):
+            self.add_agent("manual", np.array(self.size) / 2)
+        for i in range(autonomous_agents):
             self.add_agent("autonomous")
 
     # Advance to next iteration
     def next(self):
         self.internal_clock += 1
+        prof = self.profiler
+        tick_start = t = prof.start()
 
-        # Physics - collision
-        others = list(self.agents)
-        for entity in self.agents:
-
-            # border collisions are fully inelastic,
-            # if the wall is hit, normal component of the velocity vector disappears
-            adj_pos = np.clip(entity.pos, np.zeros(2) + entity.radius, self.size - entity.radius)
-            entity.vel *= adj_pos == entity.pos
-            entity.pos = adj_pos
-
-            # TODO put this into its own function and fix collision bug
-            # agent collision (the equations are for equal mass objects only)
-            others.remove(entity)
-            for entity2 in others:
-
-                # get distance to other entity
-                pos_diff = entity.pos - entity2.pos
-                d = np.linalg.norm(pos_diff)
-
-                # a collision should occur
-                if d <= entity.radius + entity2.radius:
-                    v1 = entity.vel
-                    v2 = entity2.vel
-                    entity.vel = v1 - np.dot(v1 - v2, pos_diff) / pow(d, 2) * pos_diff
-                    entity2.vel = v2 - np.dot(v2 - v1, pos_diff) / pow(d, 2) * pos_diff
-
-            entity.next()
-
-            # check if food eaten
-            for i in range(len(self.food_positions)):
-                d = np.linalg.norm(entity.pos - self.food_positions[i])
-                if d <= entity.radius + self.food_radius:
-                    entity.food_eaten += 1
-                    del self.food_positions[i]
-                    break
+        # Physics - border collisions
+        pop = self.population
+        pop.clip_to_border(self.size)
+
+        # Physics - agent collisions
+        self.collide()
+        prof.stop("collisions", t)
+        t = prof.start()
+
+        # Physics - thrust, friction and movement of all agents at once
+        pop.next()
+        prof.stop("physics", t)
+        t = prof.start()
+
+        # iterate the networks of all autonomous agents at once
+        self.network_batch.next()
+        prof.stop("networks", t)
+        t = prof.start()
+
+        for network in self.solo_networks:
+            network.next()
+        prof.stop("solo_networks", t)
+        t = prof.start()
+
+        # check which agents ate food, all at once
+        self.eat()
 
         # spawn food
-        if len(self.food_positions) < self.max_food:
-            rand = np.random.uniform()
+        if len(self.food) < self.max_food:
+            rand = self.rng.uniform()
             if rand <= 1 / self.food_spawn_rate:
-                posx = self.size[0] * np.random.uniform()
-                posy = self.size[1] * np.random.uniform()
-                self.food_positions.append(np.array((posx, posy)))
+                self.spawn_food(1)
+        prof.stop("food", t)
+
+        if self.publishing:
+            self.frame = Frame.capture(self)
+
+        prof.stop("tick", tick_start)
+        prof.tick()
+
+    def publish(self):
+        # from now on publish an immutable Frame of the state after every tick (see lib/frame.py)
+        self.publishing = True
+        self.frame = Frame.capture(self)
+
+    # positions of all food currently in the environment
+    @property
+    def food_positions(self):
+        return self.food.active
+
+    def spawn_food(self, n):
+        # spawn n pieces of food at random positions, without exceeding max_food
+        n = min(n, self.max_food - len(self.food))
+        if n > 0:
+            self.food.spawn_random(n, self.rng)
+
+    def eat(self):
+        pop = self.population
+        n = pop.count
+        eaters = self.food.consume(pop.pos[:n], pop.radius[:n] + self.food_radius)
+        pop.food_eaten[eaters] += 1
+
+    def collide(self):
+        # agent collision (the equations are for equal mass objects only)
+        # TODO fix collision bug
+        pop = self.population
+        n = pop.count
+        if n < 2: return
+        pos, vel, radius = pop.pos[:n], pop.vel[:n], pop.radius[:n]
+
+        # broad phase: only agents in the same or neighbouring grid cells can touch
+        self.collision_grid.build(pos, 2 * radius.max())
+        i, j = self.collision_grid.candidate_pairs()
+
+        # narrow phase: get distances of the candidate pairs, keep the ones that collide
+        pos_diff = pos[i] - pos[j]
+        d2 = np.einsum("ij,ij->i", pos_diff, pos_diff)
+        hit = (d2 <= (radius[i] + radius[j]) ** 2) & (d2 > 0)
+        i, j, pos_diff, d2 = i[hit], j[hit], pos_diff[hit], d2[hit]
+
+        # exchange the velocity components along the line connecting the centers
+        v_diff = vel[i] - vel[j]
+        impulse = (np.einsum("ij,ij->i", v_diff, pos_diff) / d2)[:, None] * pos_diff
+        np.subtract.at(vel, i, impulse)
+        np.add.at(vel, j, impulse)
+
+    # Advance n iterations as fast as possible
+    def step(self, n=1):
+        for i in range(n):
+            self.next()
+
+    def run_for(self, ticks=None, seconds=None):
+        # Run unthrottled until the given number of ticks is done or the wall-clock budget is used
+        # up, whichever comes first. Returns the number of ticks done
+        start = timer()
+        done = 0
+        while (ticks is None or done < ticks) and (seconds is None or timer() - start < seconds):
+            self.next()
+            done += 1
+        return done
+
+    def metrics(self):
+        # summary of the state of the environment
+        pop = self.population
+        return {
+            "ticks": self.internal_clock,
+            "agents": pop.count,
+            "food": len(self.food),
+            "food_eaten": pop.food_eaten[:pop.count].tolist(),
+            "spikes": self.spike_count,
+            "profile": self.profiler.summary(),
+        }
+
+    def record_spikes(self, path, chunk_size=1 << 16):
+        # append the spikes of all agents to an on-disk spike log from now on
+        self.stop_recording()
+        self.spike_log = SpikeLog(path, chunk_size)
+
+    def stop_recording(self):
+        if self.spike_log is not None:
+            self.spike_log.close()
+            self.spike_log = None
+
+    def save_networks(self, path):
+        # save the networks of all autonomous agents, one snapshot per agent (see lib/snapshot.py)
+        for agent in self.agents:
+            if agent.type == "autonomous":
+                agent.network.save_network(os.path.join(path, "agent_" + str(agent.id)))
+
+    def load_networks(self, path):
+        # load the networks saved by save_networks, agents without a saved network keep theirs
+        for agent in self.agents:
+            network_path = os.path.join(path, "agent_" + str(agent.id))
+            if agent.type == "autonomous" and os.path.isdir(network_path):
+                agent.network.load_network(network_path)
+
+    def close(self):
+        self.running = False
+        self.stop_recording()
+
+    def checkpoint(self, path):
+        # write the complete state of the environment to a directory, see lib/checkpoint.py
+        checkpoint.save_environment(self, path)
+
+    @classmethod
+    def restore(cls, path, seed=None):
+        # environment in the state of a checkpoint, a seed replaces its random generator
+        return checkpoint.load_environment(path, cls, seed)
+
+    def fork(self, path, n=1, seed=None):
+        # Checkpoint the environment to path and return n branches restored from it. The branches
+        # share the checkpointed arrays copy-on-write. Without a seed all branches continue like
+        # this environment would, with a seed each branch gets its own random generator
+        self.checkpoint(path)
+        return checkpoint.fork(path, n, type(self), seed)
+
+    # ticks per second run() aims for, None runs as fast as possible
+    @property
+    def target_freq(self):
+        return self.scheduler.target_freq
+
+    @target_freq.setter
+    def target_freq(self, value):
+        self.scheduler.target_freq = value
+
+    # ticks per second run() achieves, smoothed
+    @property
+    def iter_freq(self):
+        return self.scheduler.rate
+
+    def call(self, function, *args):
+        # Run function on the thread running the environment, between two ticks, so it can change
+        # networks and agents safely, for example from the GUI. When the environment is not running
+        # it is called right away
+        with self.lock:
+            if not self.running:
+                function(*args)
+                return
+            self.commands.append((function, args))
+
+    def execute_commands(self):
+        commands, self.commands = self.commands, []
+        for function, args in commands:
+            function(*args)
 
     def run(self):
         self.running = True
-        time1 = timer()
+        scheduler = self.scheduler
+        scheduler.start()
         while self.running:
-            self.next()
-            time2 = timer()
-            period = time2 - time1
-            self.iter_freq = 1 / period
-            sleep_time = 1 / self.target_freq - period
-            sleep_time = sleep_time if sleep_time >= 0 else 0
-            time.sleep(sleep_time)
-            time1 = timer()
+            scheduler.wait()
+            with self.lock:
+                self.execute_commands()
+                for i in range(scheduler.due()):
+                    if not self.running: break
+                    self.next()
+        # commands queued just before stopping
+        with self.lock:
+            self.execute_commands()
 
     def add_agent(self, type, position=None):
         # If position not supplied, put to random position
         if position is None:
             position = np.array((
-                random.uniform(10, self.size[0] - 10),
-                random.uniform(10, self.size[1] - 10)))
+                self.rng.uniform(10, self.size[0] - 10),
+                self.rng.uniform(10, self.size[1] - 10)))
 
         if type == "manual":
             self.agents.append(Agent1(position, self))
         elif type == "autonomous":
             self.agents.append(Agent2(position, self))
+            self.network_batch.add(self.agents[-1].network)
         else:
             raise ValueError
 
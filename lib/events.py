@@ -0,0 +1,113 @@
+import numpy as np
+
+
+# Calendar queue of future spike events.
+# Spikes travel along axons for a small, bounded number of iterations, so instead of a heap the
+# events are kept in a ring of slots, one per iteration. Slot time % size holds the codes of the
+# pre-synaptic neurons whose spikes arrive at that time, so fetching all spikes of an iteration is
+# a single array read. The ring grows if an event is scheduled further ahead than it can hold.
+class DelayLine():
+    def __init__(self, max_delay=16):
+        self.size = max_delay + 1
+        self.slots = [np.zeros(8, dtype=np.int64) for i in range(self.size)]
+        self.fill = [0] * self.size  # number of events in each slot
+
+    def __len__(self):
+        return sum(self.fill)
+
+    def grow(self, size, now):
+        # re-slot the pending events for a bigger ring
+        times, codes = self.pending(now)
+        self.size = size
+        self.slots = [np.zeros(8, dtype=np.int64) for i in range(self.size)]
+        self.fill = [0] * self.size
+        self.push(times, codes, now)
+
+    def append(self, slot, codes):
+        fill = self.fill[slot]
+        end = fill + len(codes)
+        if end > len(self.slots[slot]):
+            grown = np.zeros(max(2 * len(self.slots[slot]), end), dtype=np.int64)
+            grown[:fill] = self.slots[slot][:fill]
+            self.slots[slot] = grown
+        self.slots[slot][fill:end] = codes
+        self.fill[slot] = end
+
+    def push(self, times, codes, now):
+        # Schedule spikes of the neurons with the given codes to arrive at the given times.
+        # times is a single time for all codes or an array of the same length. now is the current
+        # time, no event can be scheduled before it
+        codes = np.atleast_1d(codes)
+        if len(codes) == 0: return
+        if np.ndim(times) == 0:
+            if times - now >= self.size:
+                self.grow(max(2 * self.size, times - now + 1), now)
+            self.append(int(times % self.size), codes)
+            return
+
+        if times.max() - now >= self.size:
+            self.grow(max(2 * self.size, times.max() - now + 1), now)
+        slots = times % self.size
+        order = np.argsort(slots, kind="stable")
+        slots, codes = slots[order], codes[order]
+        bounds = (np.flatnonzero(slots[1:] != slots[:-1]) + 1).tolist()
+        for start, end in zip([0] + bounds, bounds + [len(slots)]):
+            self.append(int(slots[start]), codes[start:end])
+
+    def pop(self, time):
+        # Remove and return the codes of all spikes arriving at time.
+        # The returned array is only valid until new events are pushed
+        slot = time % self.size
+        fill = self.fill[slot]
+        self.fill[slot] = 0
+        return self.slots[slot][:fill]
+
+    def pending(self, now):
+        # all pending events as (times, codes) arrays, ordered by time
+        times = [np.full(self.fill[(now + d) % self.size], now + d, dtype=np.int64)
+                 for d in range(self.size)]
+        codes = [self.slots[(now + d) % self.size][:self.fill[(now + d) % self.size]]
+                 for d in range(self.size)]
+        return np.concatenate(times), np.concatenate(codes)
+
+
+# Fixed capacity ring buffer of the most recent spikes of a network, for live visualisation.
+# When full the oldest spikes are overwritten, so memory never grows. Every spike gets a sequence
+# number, a consumer keeps the sequence number up to which it has read (its cursor) and drains
+# everything newer in one batch. Spikes that were overwritten before the consumer got to them are
+# counted as dropped.
+class SpikeRing():
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.ticks = np.zeros(capacity, dtype=np.int64)
+        self.codes = np.zeros(capacity, dtype=np.int64)
+        self.written = 0  # spikes pushed so far, the sequence number of the next spike
+        self.dropped = 0  # spikes overwritten before they were read
+        self.lag = 0  # unread spikes at the last read
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def push(self, tick, codes):
+        # spikes of the neurons with the given codes at the given tick
+        codes = np.atleast_1d(codes)
+        n = len(codes)
+        if n == 0: return
+        # of more spikes than fit only the last ones are kept, the others count as overwritten
+        first = max(0, n - self.capacity)
+        slots = (self.written + np.arange(first, n)) % self.capacity
+        self.ticks[slots] = tick
+        self.codes[slots] = codes[first:]
+        self.written += n
+
+    def clear(self):
+        self.written = self.dropped = self.lag = 0
+
+    def read(self, cursor):
+        # Spikes with a sequence number >= cursor that are still in the ring, as (ticks, codes)
+        # in the order they were pushed, and the cursor for the next read
+        self.lag = max(0, self.written - cursor)
+        oldest = max(cursor, self.written - self.capacity)
+        self.dropped += oldest - cursor
+        slots = np.arange(oldest, self.written) % self.capacity
+        return self.ticks[slots], self.codes[slots], self.written
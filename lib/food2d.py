@@ -0,0 +1,98 @@
+import numpy as np
+
+from .spatial2d import SpatialGrid
+
+
+# Storage for all food in an environment.
+# Food positions are kept densely packed at the start of a preallocated array. Eaten food is removed
+# by moving food from the end of the array into the freed slots, so no removal ever shifts the whole
+# store. A spatial grid over the food lets all agents check what they can eat in one batched query.
+class FoodStore():
+    def __init__(self, size, capacity=128, radius=3):
+        self.size = np.asarray(size, dtype=float)
+        self.radius = radius
+        self.count = 0
+        self.capacity = capacity
+        self.positions = np.zeros((capacity, 2))
+        # every piece of food gets a unique id, so it can be tracked while it moves between slots
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.next_id = 0
+
+        self.grid = SpatialGrid(self.size)
+        self.grid_dirty = True
+
+    @property
+    def active(self):
+        # view of the positions of all existing food
+        return self.positions[:self.count]
+
+    def __len__(self):
+        return self.count
+
+    def grow(self, capacity):
+        positions = np.zeros((capacity, 2))
+        positions[:self.count] = self.active
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:self.count] = self.ids[:self.count]
+        self.positions, self.ids, self.capacity = positions, ids, capacity
+
+    def spawn(self, positions):
+        # add a batch of food at the given positions, shape (n, 2)
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        n = len(positions)
+        if self.count + n > self.capacity:
+            self.grow(max(2 * self.capacity, self.count + n))
+        self.positions[self.count:self.count + n] = positions
+        self.ids[self.count:self.count + n] = np.arange(self.next_id, self.next_id + n)
+        self.next_id += n
+        self.count += n
+        self.grid_dirty = True
+
+    def spawn_random(self, n, rng=np.random):
+        # add n pieces of food at uniformly random positions
+        self.spawn(self.size * rng.uniform(size=(n, 2)))
+
+    def remove(self, indices):
+        # remove a batch of food by slot index, filling the holes with food from the end of the store
+        indices = np.unique(indices)
+        k = len(indices)
+        if k == 0: return
+        tail_start = self.count - k
+        holes = indices[indices < tail_start]
+        removed = np.zeros(k, dtype=bool)
+        removed[indices[indices >= tail_start] - tail_start] = True
+        movers = tail_start + np.nonzero(~removed)[0]
+        self.positions[holes] = self.positions[movers]
+        self.ids[holes] = self.ids[movers]
+        self.count = tail_start
+        self.grid_dirty = True
+
+    def consume(self, positions, reach):
+        # Batched eating for all agents at once. positions are the agent positions (n, 2) and
+        # reach their eating distance (n,). Every agent eats at most one piece of food and every
+        # piece of food is eaten by at most one agent, lower agent indices get served first.
+        # Returns the indices of the agents that ate
+        if self.count == 0 or len(positions) == 0:
+            return np.zeros(0, dtype=np.intp)
+
+        if self.grid_dirty:
+            self.grid.build(self.active, max(reach.max(), 1))
+            self.grid_dirty = False
+
+        # candidate pairs from neighbouring cells, then the exact distance check
+        agent, food = self.grid.query(positions, reach.max())
+        diff = positions[agent] - self.positions[food]
+        close = np.einsum("ij,ij->i", diff, diff) <= reach[agent] ** 2
+        agent, food = agent[close], food[close]
+
+        # each agent takes the first food in the store it can reach
+        order = np.lexsort((food, agent))
+        agent, food = agent[order], food[order]
+        first = np.ones(len(agent), dtype=bool)
+        first[1:] = agent[1:] != agent[:-1]
+        agent, food = agent[first], food[first]
+
+        # if several agents reached for the same food, the one with the lowest index gets it
+        food, taken = np.unique(food, return_index=True)
+        self.remove(food)
+        return agent[taken]
@@ -0,0 +1,50 @@
+import numpy as np
+
+
+def frozen(array):
+    # read only copy of an array
+    array = array.copy()
+    array.flags.writeable = False
+    return array
+
+
+# Immutable view of an environment at the end of a tick.
+# The simulation runs on its own thread while the GUI draws, so the GUI must not read the live
+# arrays, which change under it in the middle of a frame. Instead the environment publishes a new
+# Frame after every tick (see Environment.publish) by replacing its reference to the last one,
+# which is atomic, so neither side ever waits for the other. A frame only holds copies of whole
+# arrays, taking one costs a handful of array copies and no Python work per agent.
+# Frames of a simulation running in another process are views into shared memory instead,
+# see lib/remote.py
+class Frame():
+    def __init__(self, tick, size, pos, angle, radius, color, food_ids, food_pos, food_radius):
+        self.tick = tick
+        self.size = size
+        # agents, index i is the agent with id i
+        self.pos = pos
+        self.angle = angle
+        self.radius = radius
+        self.color = color
+        # food, by slot of the food store and with the ids of the food
+        self.food_ids = food_ids
+        self.food_pos = food_pos
+        self.food_radius = food_radius
+
+    @staticmethod
+    def capture(env):
+        # frame of the current state of an environment, with copies of its arrays
+        pop = env.population
+        n = pop.count
+        return Frame(
+            env.internal_clock, env.size,
+            frozen(pop.pos[:n]), frozen(pop.angle[:n]), frozen(pop.radius[:n]),
+            frozen(pop.color[:n]),
+            frozen(env.food.ids[:len(env.food)]), frozen(env.food.active), env.food_radius)
+
+    def __len__(self):
+        return len(self.pos)
+
+    def agent_at(self, position):
+        # id of the last agent covering the given position, None if there is none
+        hits = np.nonzero(np.hypot(*(self.pos - position).T) <= self.radius)[0]
+        return int(hits[-1]) if len(hits) else None
@@ -0,0 +1,105 @@
+import numpy as np
+
+
+# Environment level sources of input spikes.
+# A source drives input neurons of any number of networks and decides which of them spike in an
+# iteration for all networks at once. The networks of a NetworkBatch take their spikes from it in
+# one go, networks stepped on their own take their share with spikes. Sources register with
+# env.input_sources and their neurons register with the source when they are created.
+class InputSource():
+    # whether the spikes count towards env.spike_count, the spike statistics of the networks
+    counted = True
+
+    def __init__(self, env):
+        self.env = env
+        self.neurons = []
+        self.invalidate()
+
+    def add(self, neuron):
+        self.neurons.append(neuron)
+        self.invalidate()
+
+    def remove(self, network):
+        # forget the neurons of a network, for example when it is cleared
+        self.neurons = [neuron for neuron in self.neurons if neuron.network is not network]
+        self.invalidate()
+
+    def invalidate(self):
+        # the neurons or their parameters changed
+        self.dirty = True
+        self.clock = None
+
+    def rebuild(self):
+        # per neuron arrays: index of the network, input index and agent id. The neurons are
+        # sorted, so environments restored from a checkpoint have them in the same order
+        self.neurons.sort(key=lambda neuron: (neuron.network.agent.id, neuron.id[1]))
+        neurons = self.neurons
+        self.networks = list({id(n.network): n.network for n in neurons}.values())
+        index = {id(net): k for k, net in enumerate(self.networks)}
+        self.network_index = np.array([index[id(n.network)] for n in neurons], dtype=np.int64)
+        self.input_index = np.array([n.id[1] for n in neurons], dtype=np.int64)
+        self.agent_id = np.array([n.network.agent.id for n in neurons], dtype=np.int64)
+        # index of the network in the NetworkBatch stepping it, -1 if it is stepped on its own
+        self.batch_index = np.array(
+            [-1 if net.batch is None else net.batch_index for net in self.networks], dtype=np.int64)
+        self.dirty = False
+
+    def fire(self, clock):
+        # indices (into self.neurons) of the neurons spiking at clock, defined by the sources.
+        # Without a definition no neuron ever spikes
+        return np.zeros(0, dtype=np.int64)
+
+    def due(self, clock):
+        # indices (into self.neurons) of the neurons spiking at clock, computed once per iteration
+        if clock != self.clock:
+            if self.dirty:
+                self.rebuild()
+            self.clock, self.current = clock, self.fire(clock)
+        return self.current
+
+    def spikes(self, network, clock):
+        # input indices of the neurons of one network spiking at clock
+        due = self.due(clock)
+        if len(due) == 0 or network not in self.networks:
+            return due[:0]
+        k = self.networks.index(network)
+        return self.input_index[due[self.network_index[due] == k]]
+
+
+class RandomInputs(InputSource):
+    def __init__(self, env, block=256):
+        self.block = block
+        super().__init__(env)
+
+    def invalidate(self):
+        # draw a new block with the current neurons and periods at the next iteration
+        super().invalidate()
+        self.block_end = -1
+
+    def rebuild(self):
+        super().rebuild()
+        self.spike_p = np.clip([n.spike_p for n in self.neurons], 0, 1).astype(float)
+
+    def draw(self, start):
+        # draw the spikes of all neurons in the block of iterations starting at start
+        rng = self.env.rng
+        end = start + self.block
+        times, neurons = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        alive = np.nonzero(self.spike_p > 0)[0]
+        t = start - 1 + rng.geometric(self.spike_p[alive])
+        while len(alive):
+            inside = t < end
+            alive, t = alive[inside], t[inside]
+            times.append(t)
+            neurons.append(alive)
+            t = t + rng.geometric(self.spike_p[alive])
+        times, neurons = np.concatenate(times), np.concatenate(neurons)
+        order = np.argsort(times, kind="stable")
+        self.times, self.spiking = times[order], neurons[order]
+        self.block_end = end
+
+    def fire(self, clock):
+        if clock >= self.block_end:
+            self.draw(clock)
+        start, end = np.searchsorted(self.times, (clock, clock + 1))
+        return self.spiking[start:end]
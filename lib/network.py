@@ -1,7 +1,7 @@
-import numpy as np
-import heapq
-
 from . import neurons
+from . import snapshot
+from .connectome import Connectome
+from .events import DelayLine, SpikeRing
 
 
 class Network():
@@ -11,7 +11,7 @@ class Network():
         self.neuron_count = [0, 0, 0]  # input, output and interneurons respectively
         # the neuron count is accessed and incremented by the neuron init function
 
-        # TODO add sensory neurons
+        # random and sensory neurons, their spikes come from the input sources of the environment
         self.inputs = []
 
         # the outputs are always the possible actions the agent can take
@@ -21,82 +21,153 @@ class Network():
 
         # TODO put this in some more suitable datastructure
         self.interneurons = []
+        # parameters and state of the interneurons as arrays, iterated all at once
+        self.population = neurons.LIFPopulation(event_driven=agent.env.event_driven)
+        # neurons that read their dna every iteration
+        self.growing = []
 
-        # events are the ids of the neurons that spiked
+        # events are the codes of the neurons that spiked, stored in a delay line by arrival time
         # TODO add other things into the event later like, axon coordinates,
         # maybe neurotransmitter type
-        self.future_queue = []
-        heapq.heapify(self.future_queue)
+        self.future_queue = DelayLine()
 
         # connectome matrix W where wij is the synnapse weight between ith post-synaptic
         # and jth pre-synaptic neuron it is initialized with only the input and output
-        # neurons none of which are connected making the connectome an all zero matrix
-        self.connectome = np.zeros((self.neuron_count[1] + self.neuron_count[2],
-                                    self.neuron_count[0] + self.neuron_count[2]))
+        # neurons none of which are connected. It is stored sparsely, see lib/connectome.py
+        self.connectome = Connectome(*self.neuron_count)
+        self.connectome.on_change = self.topology_changed
+
+        # the NetworkBatch stepping this network together with others, if any (see lib/batch.py)
+        self.batch = None
+        self.batch_index = None
+        # functions called with every topology change, see topology_changed
+        self.listeners = []
 
         # A flag if the network is being recorded
-        self.spike_tracking = False
-        # Another queue for spike tracking
-        self.recording = []
-        heapq.heapify(self.recording)
+        self._spike_tracking = False
+        # the most recent spikes as (tick, neuron code) while tracking, for the live view
+        self.recording = SpikeRing()
+
+    @property
+    def spike_tracking(self):
+        return self._spike_tracking
+
+    @spike_tracking.setter
+    def spike_tracking(self, value):
+        self._spike_tracking = value
+        if self.batch is not None:
+            self.batch.tracking[self.batch_index] = value
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    def topology_changed(self, *event):
+        # Publish a change of the topology to all listeners. The events are the ones of the
+        # connectome (see lib/connectome.py) and "reset" when the whole network was replaced
+        for listener in self.listeners:
+            listener(*event)
 
     def next(self):
-        # first, iteration of individual neurons
+        prof = self.agent.env.profiler
+        t = prof.start()
+
+        # first, the spikes of the inputs, computed for all networks at once (see lib/inputs.py)
         # TODO setting for neuron iteration per network iteration. currently it is one
-        for neuron in self.inputs:
-            neuron.next()
-        for neuron in self.interneurons:
-            neuron.next()
-
-        # Create an event vector from all the neurons that spiked
-        pre_synaptic_vector = np.zeros((self.connectome.shape[1]), dtype=bool)
-
-        # Fetch all events for current iteration from the future queue and add them to the vector
-        try:
-            while self.future_queue[0][0] == self.agent.env.internal_clock:
-                spike_id = heapq.heappop(self.future_queue)[1]
-                if spike_id[0] == 0:
-                    pre_synaptic_vector[spike_id[1]] = 1
-                else:
-                    pre_synaptic_vector[self.neuron_count[0] + spike_id[1]] = 1
-        except IndexError:
-            pass
+        clock = self.agent.env.internal_clock
+        for source in self.agent.env.input_sources:
+            inputs = source.spikes(self, clock)
+            if len(inputs):
+                self.input_spikes(inputs, source.counted)
+        prof.stop("networks/inputs", t)
+        t = prof.start()
+
+        spikes = self.population.next(clock)
+        if len(spikes):
+            self.future_queue.push(clock + self.population.axon_length[spikes], spikes, clock)
+            self.record_spikes(clock, spikes)
+        for neuron in self.growing:
+            neuron.read_dna()
+        prof.stop("networks/neurons", t)
+        t = prof.start()
+
+        # Fetch all events for current iteration from the delay line
+        fired = self.future_queue.pop(clock)
+        prof.count("spikes_delivered", len(fired))
 
         # check if any spikes happened this iteration, because otherwise nothing needs to be done
-        if not np.all(pre_synaptic_vector is False):
-            # Now send the pre-synaptic vector through the connectome matrix to get a
-            # post-synaptic vector
-            post_synaptic_vector = np.dot(self.connectome, pre_synaptic_vector)
+        if len(fired):
+            # Now send the spikes through the connectome, only the synapses of the neurons that
+            # fired are touched
+            post, values = self.connectome.propagate(fired)
             # TODO add a way of knowing for neurons which neuron excited them
-            if not np.all(post_synaptic_vector == 0.0):
-                excitations = np.nonzero(post_synaptic_vector)[0]
-                for i in excitations:
-                    if i < self.neuron_count[1]:
-                        self.outputs[i].excite()
-                    else:
-                        self.interneurons[i - self.neuron_count[1]].excite(post_synaptic_vector[i])
+            excited = values != 0.0
+            post, values = post[excited], values[excited]
+            for code in post[post < 0]:
+                self.outputs[-1 - code].excite()
+            self.population.excite(post[post >= 0], values[post >= 0])
+        prof.stop("networks/delivery", t)
+
+    def input_spikes(self, indices, counted=True):
+        # spikes of the input neurons with the given indices in the current iteration,
+        # counted in env.spike_count unless told otherwise
+        clock = self.agent.env.internal_clock
+        codes = -1 - indices
+        self.future_queue.push(clock, codes, clock)
+        self.record_spikes(clock, codes, counted)
+
+    def record_spikes(self, clock, codes, counted=True):
+        # bookkeeping of the spikes of the neurons with the given codes at clock: the spike count
+        # of the environment, the spike log and the spike ring while tracking.
+        # NetworkBatch.record_spikes does the same for the networks of a batch
+        env = self.agent.env
+        if counted:
+            env.spike_count += len(codes)
+        if env.spike_log is not None:
+            env.spike_log.append(clock, self.agent.id, codes)
+        # Spike tracking
+        if self.spike_tracking:
+            self.recording.push(clock, codes)
 
     def add_neuron(self, neuron):
         if neuron.type == "input":
             self.inputs.append(neuron)
-            self.connectome = np.hstack((self.connectome[:, 0:len(self.inputs)],
-                                        np.zeros(self.connectome.shape[0])[:, None],
-                                        self.connectome[:, len(self.inputs):]))
         if neuron.type == "output":
             self.outputs.append(neuron)
-            self.connectome = np.vstack((self.connectome[0:len(self.outputs), :],
-                                        np.zeros(self.connectome.shape[1]),
-                                        self.connectome[len(self.outputs):, :]))
         if neuron.type == "inter":
             self.interneurons.append(neuron)
-            self.connectome = np.hstack((self.connectome,
-                                        np.zeros(self.connectome.shape[0])[:, None]))
-            self.connectome = np.vstack((self.connectome, np.zeros(self.connectome.shape[1])))
-
-    # TODO add ability to load saved network from file
-    def load_network(self):
-        # load network state from file
-        pass
+            if isinstance(neuron, neurons.GrowingNeuron):
+                self.growing.append(neuron)
+        self.connectome.add_neuron(neuron.type)
+
+    def clear(self):
+        # remove all input and interneurons and their synapses, pending spikes are dropped
+        for source in self.agent.env.input_sources:
+            source.remove(self)
+        self.inputs = []
+        self.interneurons = []
+        self.growing = []
+        self.recording.clear()
+        self.neuron_count[0] = self.neuron_count[2] = 0
+        self.population = neurons.LIFPopulation(event_driven=self.agent.env.event_driven)
+        if self.batch is not None:
+            self.batch.clear_events(self)
+        else:
+            self.future_queue = DelayLine(self.future_queue.size - 1)
+        self.set_connectome(Connectome(*self.neuron_count))
+
+    def set_connectome(self, connectome):
+        self.connectome = connectome
+        self.connectome.on_change = self.topology_changed
+        self.topology_changed("reset")
+
+    def load_network(self, path=None):
+        # load network state from a snapshot written by save_network, see lib/snapshot.py
+        if path is not None:
+            snapshot.load_network(self, path)
+            return
 
         # this is just for testing TODO rewrite this completely
 
@@ -115,9 +186,9 @@ class Network():
         # self.connectome[6, 5] = 1
         # self.connectome[2, 6] = 1
 
-    def save_network(self):
-        # save network state to file
-        pass
+    def save_network(self, path):
+        # save network state to a snapshot directory
+        snapshot.save_network(self, path)
 
     def grow(self, dna):
         # grow network from dna sequence
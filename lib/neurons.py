@@ -1,5 +1,146 @@
 import numpy as np
-import heapq
+
+
+def population_field(name):
+    # property that reads and writes an interneuron's entry in the network population arrays
+    def fget(self):
+        return getattr(self.network.population, name)[self.id[1]]
+
+    def fset(self, value):
+        self.network.population.set(name, self.id[1], value)
+
+    return property(fget, fset)
+
+
+class LIFPopulation():
+    # Parameters and state of all interneurons of a network, stored as arrays indexed by the
+    # interneuron id. Threshold detection, reset and leak of all neurons run as array operations.
+    # Interneurons without dynamics have an infinite threshold and never spike.
+    #
+    # Event driven, only the neurons excited since the last iteration are touched. Without input
+    # the activation of a neuron only decays, so a neuron can only reach its threshold in the
+    # iteration after it was excited. The leak is applied lazily: every neuron remembers the
+    # iteration its activation belongs to (stamp) and when it is excited next, the missed
+    # iterations of leak are applied at once as (1 - leak)^dt. Iterations without any input cost
+    # nothing. The activations of untouched neurons are stale, settle brings them up to date
+
+    # names of the per-neuron arrays saved in snapshots
+    fields = ("activation", "threshold", "leak", "axon_length")
+    # all per-neuron arrays, used when growing and packing the storage
+    arrays = fields + ("stamp",)
+    # activations decaying below this are set to 0 when event driven
+    epsilon = 1e-12
+
+    def __init__(self, capacity=8, event_driven=False):
+        self.count = 0
+        self.capacity = capacity
+        self.event_driven = event_driven
+
+        # parameters
+        self.threshold = np.full(capacity, np.inf)
+        self.leak = np.zeros(capacity)
+        self.axon_length = np.zeros(capacity, dtype=int)
+
+        # state
+        self.activation = np.zeros(capacity)
+        # event driven: iteration whose threshold check the activation is the value for, -1 for
+        # activations set from outside, which are up to date. And the last iteration and the
+        # neurons excited since then
+        self.stamp = np.full(capacity, -1, dtype=np.int64)
+        self.clock = 0
+        self.excited = []
+        self.check_all = True  # check every neuron once, for example after packing
+        # the population this one is a slice of, if any, and the index of its first neuron there
+        # (see NetworkBatch.attach). Neurons are excited and set through it
+        self.base = None
+        self.offset = 0
+
+    def add(self):
+        # reserve a slot for a new neuron and return its index
+        if self.count == self.capacity:
+            self.grow(max(1, 2 * self.capacity))
+        self.stamp[self.count] = -1
+        self.count += 1
+        return self.count - 1
+
+    def grow(self, capacity):
+        # the arrays are no longer views of the base population
+        self.base = None
+        for name in LIFPopulation.arrays:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+        self.threshold[self.count:] = np.inf
+        self.capacity = capacity
+
+    def excite(self, indices, values):
+        if self.base is not None:
+            self.base.excite(self.offset + np.asarray(indices), values)
+            return
+        # when every neuron is checked in the next iteration anyway, nothing has to be tracked
+        if self.event_driven and not self.check_all:
+            touched = np.unique(indices)
+            self.decay(touched, self.clock + 1)
+            self.excited.append(touched)
+        np.add.at(self.activation, indices, values)
+
+    def set(self, name, index, value):
+        # write a parameter or the state of one neuron from outside, event driven the neuron is
+        # checked in the next iteration like an excited one
+        if self.base is not None:
+            self.base.set(name, self.offset + index, value)
+            return
+        if self.event_driven:
+            if not self.check_all:
+                touched = np.array([index])
+                self.decay(touched, self.clock + 1)
+                self.excited.append(touched)
+            elif name == "activation":
+                self.stamp[index] = -1  # up to date, every neuron is checked next iteration
+        getattr(self, name)[index] = value
+
+    def decay(self, indices, stamp):
+        # apply the leak of the iterations up to stamp to some neurons
+        activation = self.activation[indices]
+        dt = np.where(self.stamp[indices] < 0, 0, stamp - self.stamp[indices])
+        # like the dense stepping, a step resets activations that are not positive
+        activation = np.where(activation > 0.0, activation * (1 - self.leak[indices]) ** dt,
+                              np.where(dt > 0, 0.0, activation))
+        activation[(activation > 0.0) & (activation < LIFPopulation.epsilon)] = 0.0
+        self.activation[indices] = activation
+        self.stamp[indices] = stamp
+
+    def settle(self, clock):
+        # bring the activations of all neurons up to date at the end of iteration clock
+        if self.event_driven:
+            self.decay(np.arange(self.count), clock + 1)
+
+    def next(self, clock=None):
+        # iterate all neurons at once, returns the indices of the neurons that spiked
+        n = self.count
+        if not self.event_driven:
+            activation = self.activation[:n]
+            spiking = activation >= self.threshold[:n]
+            activation[:] = np.where(
+                spiking | (activation <= 0.0), 0.0, activation * (1 - self.leak[:n]))
+            return np.nonzero(spiking)[0]
+
+        self.clock = clock
+        if self.check_all:
+            self.check_all = False
+            self.excited = []
+            self.decay(np.arange(n), clock)
+            candidates = np.arange(n)
+        elif self.excited:
+            candidates = np.unique(np.concatenate(self.excited))
+            self.excited = []
+        else:
+            return np.zeros(0, dtype=np.int64)
+        activation = self.activation[candidates]
+        spiking = activation >= self.threshold[candidates]
+        self.activation[candidates[spiking | (activation <= 0.0)]] = 0.0
+        return candidates[spiking]
 
 
 class NeuronBase():
@@ -21,6 +162,9 @@ class NeuronBase():
         else:
             raise ValueError
 
+        # code identifying the neuron in the connectome, see lib/connectome.py
+        self.code = self.id[1] if type == "inter" else -1 - self.id[1]
+
     def __lt__(self, other):
         return self.id < other.id
 
@@ -30,15 +174,9 @@ class InputNeuron(NeuronBase):
         super().__init__(network, "input")
 
     def spike(self):
-        heapq.heappush(
-            self.network.future_queue,
-            (self.network.agent.env.internal_clock, self.id))
-
-        # Spike tracking
-        if self.network.spike_tracking:
-            heapq.heappush(
-                self.network.recording,
-                (self.network.agent.env.internal_clock, self))
+        clock = self.network.agent.env.internal_clock
+        self.network.future_queue.push(clock, self.code, clock)
+        self.network.record_spikes(clock, np.array([self.code]))
 
 
 class OutputNeuron(NeuronBase):
@@ -51,24 +189,23 @@ class OutputNeuron(NeuronBase):
 
 
 class Neuron(NeuronBase):
+    # the parameters and state of interneurons live in network.population,
+    # the neuron objects are views into that storage
+    axon_length = population_field("axon_length")
+
     def __init__(self, network):
         super().__init__(network, "inter")
+        network.population.add()
 
         self.axon_length = 10
         self.axon_angle = 0
 
     def spike(self):
         # spike method called when the neuron fires
-        # push a spike event to the network event heap
-        heapq.heappush(
-            self.network.future_queue,
-            (self.network.agent.env.internal_clock + self.axon_length, self.id))
-
-        # Spike tracking
-        if self.network.spike_tracking:
-            heapq.heappush(
-                self.network.recording,
-                (self.network.agent.env.internal_clock, self))
+        # push a spike event into the network delay line, it arrives when it reaches the axon end
+        clock = self.network.agent.env.internal_clock
+        self.network.future_queue.push(clock + self.axon_length, self.code, clock)
+        self.network.record_spikes(clock, np.array([self.code]))
 
     def excite(self, value):
         pass
@@ -80,6 +217,13 @@ class Neuron(NeuronBase):
 
 class Neuron_LIF(Neuron):
     # Leaky Integrate and fire Neuron
+    # The network iterates all of its LIF neurons at once through network.population,
+    # next and excite are kept for stepping a single neuron. When the population is event driven
+    # the activation may be stale until population.settle is called
+    threshold = population_field("threshold")
+    leak = population_field("leak")
+    activation = population_field("activation")
+
     def __init__(self, network):
         super().__init__(network)
 
@@ -99,24 +243,52 @@ class Neuron_LIF(Neuron):
         else: self.activation = 0.0
 
     def excite(self, value):
-        self.activation += value
+        self.network.population.excite(np.array([self.id[1]]), [value])
 
 
 class Neuron_random(InputNeuron):
-    # Neuron that spikes at random times, handled as a type of input neuron
+    # Neuron that spikes at random times, handled as a type of input neuron.
+    # The spikes of all random neurons of the environment are drawn at once by env.random_inputs
+    # (see lib/inputs.py), next is kept for stepping a single neuron
     def __init__(self, network):
         super().__init__(network)
 
         # the expected value of iterations between consecutive spikes
-        self.exp_spike_period = 20
-        self.spike_p = 1 / self.exp_spike_period
+        self._exp_spike_period = 20
+        network.agent.env.random_inputs.add(self)
+
+    @property
+    def exp_spike_period(self):
+        return self._exp_spike_period
+
+    @exp_spike_period.setter
+    def exp_spike_period(self, value):
+        self._exp_spike_period = value
+        self.network.agent.env.random_inputs.invalidate()
+
+    @property
+    def spike_p(self):
+        return 1 / self.exp_spike_period
 
     def next(self):
-        rand = np.random.uniform()
+        rand = self.network.agent.env.rng.uniform()
         if rand <= self.spike_p:
             self.spike()
 
 
+class VisionNeuron(InputNeuron):
+    # Input neuron seeing along one ray of the vision of its agent, see lib/vision.py.
+    # The vision neurons of a network are created in order, for every target all of its rays
+    def __init__(self, network):
+        vision = network.agent.env.vision
+        if vision is None:
+            raise ValueError("vision is not enabled in the environment")
+        super().__init__(network)
+        channel = sum(isinstance(neuron, VisionNeuron) for neuron in network.inputs)
+        self.target, self.ray = divmod(channel, vision.rays)
+        vision.add(self)
+
+
 class GrowingNeuron(Neuron_LIF):
     def __init__(self, network, dna):
         super().__init__(network)
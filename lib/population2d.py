@@ -0,0 +1,74 @@
+import numpy as np
+
+
+# Struct-of-arrays storage for the physical state (and the food counters) of every agent.
+# Agents only hold their index into these arrays (see agents2d), so thrust, friction, integration
+# and border clipping of the whole population run as a handful of vectorized operations
+class Population():
+
+    # names of the per-agent arrays, used when growing the storage
+    fields = ("pos", "vel", "angle", "force", "mass", "friction", "radius", "food_eaten", "color")
+
+    def __init__(self, capacity=16):
+        self.count = 0
+        self.capacity = capacity
+
+        self.pos = np.zeros((capacity, 2))
+        self.vel = np.zeros((capacity, 2))
+        self.angle = np.zeros(capacity)
+        self.force = np.zeros(capacity)
+        self.mass = np.ones(capacity)
+        self.friction = np.zeros(capacity)
+        self.radius = np.zeros(capacity)
+        self.food_eaten = np.zeros(capacity, dtype=int)
+        self.color = np.zeros((capacity, 3), dtype=np.uint8)  # only used for drawing
+
+    def add(self):
+        # reserve a slot for a new agent and return its index
+        if self.count == self.capacity:
+            self.grow(max(1, 2 * self.capacity))
+        self.count += 1
+        return self.count - 1
+
+    def grow(self, capacity):
+        # reallocate all arrays with a bigger capacity, amortised O(1) per added agent
+        for name in Population.fields:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+        self.mass[self.count:] = 1
+        self.capacity = capacity
+
+    def clip_to_border(self, size):
+        # border collisions are fully inelastic,
+        # if the wall is hit, normal component of the velocity vector disappears
+        n = self.count
+        pos = self.pos[:n]
+        radius = self.radius[:n, None]
+        adj_pos = np.clip(pos, radius, size - radius)
+        self.vel[:n] *= adj_pos == pos
+        pos[:] = adj_pos
+
+    def next(self):
+        # Advance the physics of all agents by one iteration
+        n = self.count
+        vel = self.vel[:n]
+        force = self.force[:n]
+        friction = self.friction[:n]
+
+        # If force is applied, the body accelerates
+        acc = np.where(force > 0, force / self.mass[:n], 0.0)
+        vel[:, 0] += acc * np.cos(self.angle[:n])
+        vel[:, 1] += acc * np.sin(self.angle[:n])
+
+        # If the body moves friction slows it down, slow bodies stop completely
+        speed = np.hypot(vel[:, 0], vel[:, 1])
+        moving = speed > friction
+        vel *= np.where(moving, 1 - friction / np.where(moving, speed, 1.0), 0.0)[:, None]
+
+        # Adjust the position according to speed
+        self.pos[:n] += vel
+
+        # force decays TODO make it possible for the force to be a float value
+        force[force >= 1] -= 1
@@ -0,0 +1,78 @@
+import numpy as np
+from timeit import default_timer as timer
+
+
+# Low overhead instrumentation of the simulation loop.
+# Phases of an iteration are timed with start/stop pairs, counters (like delivered spikes) are
+# summed over an iteration. The last `window` values of every phase and counter are kept in ring
+# buffers, from which rolling percentiles are computed on demand. When disabled, start/stop/count
+# return immediately, so the instrumentation can stay in the hot path and be switched on at runtime.
+class Profiler():
+    percentiles = (50, 90, 99)
+
+    def __init__(self, window=256, enabled=False):
+        self.enabled = enabled
+        self.window = window
+        self.rings = {}  # name -> [values, number of values recorded so far]
+        self.counts = {}  # counters of the current iteration
+
+    def start(self):
+        return timer() if self.enabled else None
+
+    def stop(self, phase, start):
+        if start is not None:
+            self.record(phase, timer() - start)
+
+    def count(self, counter, n):
+        if self.enabled:
+            self.counts[counter] = self.counts.get(counter, 0) + n
+
+    def tick(self):
+        # ends an iteration, the counters are recorded and reset
+        if not self.enabled: return
+        for counter, n in self.counts.items():
+            self.record(counter, n)
+            self.counts[counter] = 0
+
+    def record(self, name, value):
+        rings = self.rings
+        ring = rings.get(name)
+        if ring is None:
+            ring = rings[name] = [np.zeros(self.window), 0]
+        ring[0][ring[1] % self.window] = value
+        ring[1] += 1
+
+    def reset(self):
+        # new dicts are swapped in, so the simulation thread recording into them and readers on
+        # other threads never see a dict being emptied
+        self.rings = {}
+        self.counts = {}
+
+    def values(self, name):
+        # the recorded values of the rolling window
+        ring = self.rings[name]
+        return ring[0][:min(ring[1], self.window)]
+
+    def summary(self):
+        # name -> mean and rolling percentiles, times are in seconds. Safe to call from another
+        # thread than the one recording, it works on a snapshot of the recorded names
+        result = {}
+        for name, (values, n) in list(self.rings.items()):
+            if n == 0: continue  # just created by the recording thread
+            values = values[:min(n, self.window)]
+            stats = {"mean": float(values.mean()), "n": n}
+            for q, p in zip(Profiler.percentiles, np.percentile(values, Profiler.percentiles)):
+                stats["p" + str(q)] = float(p)
+            result[name] = stats
+        return result
+
+    def report(self):
+        # the summary as text lines, times in milliseconds
+        lines = []
+        for name, stats in sorted(self.summary().items()):
+            if name.startswith("spikes"):
+                lines.append(f"{name}: mean {stats['mean']:.1f}, p99 {stats['p99']:.0f} per tick")
+            else:
+                lines.append(f"{name}: p50 {stats['p50'] * 1e3:.3f} p90 {stats['p90'] * 1e3:.3f} "
+                             f"p99 {stats['p99'] * 1e3:.3f} ms")
+        return lines
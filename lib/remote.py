@@ -0,0 +1,266 @@
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .frame import Frame
+from .profiler import Profiler
+
+# Simulation in a child process, so simulating and drawing do not compete for the GIL.
+#
+# The child runs the Environment and after every tick writes the agent and food arrays into a block
+# of shared memory, which the GUI maps without copying. The block holds three slots (triple
+# buffering): the one last published, the one the GUI is reading and the one being written, so
+# neither process ever waits for the other and the GUI never sees a half written tick.
+# Everything else (start, stop, speed, agent control, saving networks) travels as small tuples over
+# a pipe, see simulate for the commands.
+
+SLOTS = 3
+# header entries, all stored as float64
+LATEST, CLAIM, PUBLISHED, TICK, ITER_FREQ, SPIKES, HEADER_SIZE = range(7)
+
+
+class SharedState():
+    # Layout of the shared memory block. Created by the GUI process, attached to by the child
+    def __init__(self, agents, food, name=None):
+        self.agents, self.food = agents, food
+        fields = [("header", np.float64, (HEADER_SIZE,))]
+        for k in range(SLOTS):
+            fields += [
+                (f"counts{k}", np.int64, (3,)),  # agents, food, tick
+                (f"pos{k}", np.float64, (agents, 2)),
+                (f"angle{k}", np.float64, (agents,)),
+                (f"radius{k}", np.float64, (agents,)),
+                (f"food_ids{k}", np.int64, (food,)),
+                (f"food_pos{k}", np.float64, (food, 2)),
+                (f"color{k}", np.uint8, (agents, 3)),
+            ]
+        # offsets of the arrays in the block, 8 byte aligned
+        layout, size = [], 0
+        for field, dtype, shape in fields:
+            layout.append((field, dtype, shape, size))
+            size += -(-int(np.prod(shape)) * np.dtype(dtype).itemsize // 8) * 8
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.arrays = {field: np.ndarray(shape, dtype, buffer=self.memory.buf, offset=offset)
+                       for field, dtype, shape, offset in layout}
+        self.header = self.arrays["header"]
+        if name is None:
+            self.header[:] = 0
+            self.header[CLAIM] = -1
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def slot(self, k, name):
+        return self.arrays[name + str(k)]
+
+    def write(self, env):
+        # publish the state of env, called by the child after every tick
+        header = self.header
+        latest, claimed = int(header[LATEST]), int(header[CLAIM])
+        k = next(k for k in range(SLOTS) if k != latest and k != claimed)
+        pop = env.population
+        n, m = min(pop.count, self.agents), min(len(env.food), self.food)
+        self.slot(k, "pos")[:n] = pop.pos[:n]
+        self.slot(k, "angle")[:n] = pop.angle[:n]
+        self.slot(k, "radius")[:n] = pop.radius[:n]
+        self.slot(k, "color")[:n] = pop.color[:n]
+        self.slot(k, "food_ids")[:m] = env.food.ids[:m]
+        self.slot(k, "food_pos")[:m] = env.food.active[:m]
+        self.slot(k, "counts")[:] = (n, m, env.internal_clock)
+        header[TICK] = env.internal_clock
+        header[SPIKES] = env.spike_count
+        header[LATEST] = k
+        header[PUBLISHED] += 1
+
+    def claim(self):
+        # Reserve the last published slot for reading, the writer will not touch it until another
+        # slot is claimed. Retried if a newer slot was published in the meantime, as the writer
+        # may then already have chosen the slot that was about to be claimed
+        while True:
+            latest = self.header[LATEST]
+            published = self.header[PUBLISHED]
+            self.header[CLAIM] = latest
+            if self.header[LATEST] == latest:
+                return int(latest), published
+
+    def close(self, unlink=False):
+        self.arrays = self.header = None
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+def simulate(conn, name, agents, food, settings):
+    # Body of the child process: builds the environment, then steps it while running and
+    # executes the commands arriving over conn:
+    #   ("start",), ("stop",), ("speed", target_freq or None for max speed), ("close",)
+    #   ("act", agent id, action name, *args)      move, turn_left or turn_right of an agent
+    #   ("save_networks", path), ("load_networks", path)
+    from .env2d import Environment
+
+    env = Environment(**settings)
+    env.max_food = food  # the food slots of the shared state
+    state = SharedState(agents, food, name)
+    state.write(env)
+    conn.send(("ready", env.food_radius))
+
+    running = False
+    scheduler = env.scheduler
+    while True:
+        # while running, wait for commands only until the next tick is due
+        while conn.poll(scheduler.wait_time() if running else 0.1):
+            command = conn.recv()
+            if command[0] == "start":
+                running = True
+                scheduler.start()
+            elif command[0] == "stop":
+                running = False
+            elif command[0] == "speed":
+                env.target_freq = command[1]
+            elif command[0] == "act":
+                getattr(env.agents[command[1]], command[2])(*command[3:])
+            elif command[0] == "save_networks":
+                env.save_networks(command[1])
+            elif command[0] == "load_networks":
+                env.load_networks(command[1])
+            elif command[0] == "close":
+                env.close()
+                state.close()
+                return
+        if not running:
+            continue
+
+        n = scheduler.due()
+        for i in range(n):
+            env.next()
+        if n:
+            state.header[ITER_FREQ] = env.iter_freq
+            state.write(env)
+
+
+class RemoteAgent():
+    # stands in for an agent of the remote environment, its actions are sent as commands
+    def __init__(self, env, id):
+        self.env = env
+        self.id = id
+
+    def move(self, force=1):
+        self.env.send("act", self.id, "move", force)
+
+    def turn_right(self):
+        self.env.send("act", self.id, "turn_right")
+
+    def turn_left(self):
+        self.env.send("act", self.id, "turn_left")
+
+
+class RemoteEnvironment():
+    # Environment running in a child process, with the parts of the Environment interface the GUI
+    # uses: frames, start/stop through run() and running, the target frequency, agent actions and
+    # saving and loading networks. The networks themselves stay in the child process
+    def __init__(self, seed=None, manual_agents=1, autonomous_agents=10, size=(1300, 900),
+                 max_food=100):
+        self.size = np.array(size)
+        self.profiler = Profiler()  # the phases are timed in the child, not shown here
+        self.state = SharedState(manual_agents + autonomous_agents, max_food)
+        self.conn, child_conn = multiprocessing.Pipe()
+        settings = dict(seed=seed, manual_agents=manual_agents,
+                        autonomous_agents=autonomous_agents, size=size)
+        # spawned rather than forked, the parent may have initialized pygame
+        self.process = multiprocessing.get_context("spawn").Process(
+            target=simulate, args=(child_conn, self.state.name, self.state.agents,
+                                   self.state.food, settings), daemon=True)
+        self.process.start()
+        ready, self.food_radius = self.conn.recv()  # wait until the environment is built
+
+        self.agents = [RemoteAgent(self, i) for i in range(self.state.agents)]
+        self._running = False
+        self._target_freq = 50
+        self._frame = None
+        self.frame_number = None
+
+    def send(self, *command):
+        self.conn.send(command)
+
+    @property
+    def frame(self):
+        # The last published state, as views into the shared memory. The frame stays valid until
+        # the next frame is taken
+        k, published = self.state.claim()
+        if published != self.frame_number:
+            n, m, tick = self.state.slot(k, "counts")
+            self._frame = Frame(
+                int(tick), self.size,
+                read_only(self.state.slot(k, "pos")[:n]),
+                read_only(self.state.slot(k, "angle")[:n]),
+                read_only(self.state.slot(k, "radius")[:n]),
+                read_only(self.state.slot(k, "color")[:n]),
+                read_only(self.state.slot(k, "food_ids")[:m]),
+                read_only(self.state.slot(k, "food_pos")[:m]), self.food_radius)
+            self.frame_number = published
+        return self._frame
+
+    @property
+    def internal_clock(self):
+        return int(self.state.header[TICK])
+
+    @property
+    def spike_count(self):
+        return int(self.state.header[SPIKES])
+
+    @property
+    def iter_freq(self):
+        return self.state.header[ITER_FREQ]
+
+    @property
+    def target_freq(self):
+        return self._target_freq
+
+    @target_freq.setter
+    def target_freq(self, value):
+        self._target_freq = value
+        self.send("speed", value)
+
+    @property
+    def running(self):
+        return self._running
+
+    @running.setter
+    def running(self, value):
+        self._running = value
+        self.send("start" if value else "stop")
+
+    def publish(self):
+        # the child process always publishes its state
+        pass
+
+    def run(self):
+        # starts the simulation and returns right away, the child process does the work
+        self.running = True
+
+    def call(self, function, *args):
+        # the commands are executed between two ticks by the child process anyway
+        function(*args)
+
+    def save_networks(self, path):
+        self.send("save_networks", path)
+
+    def load_networks(self, path):
+        self.send("load_networks", path)
+
+    def close(self):
+        if self.process.is_alive():
+            self.send("close")
+            self.process.join(timeout=5)
+        self._frame = None
+        self.state.close(unlink=True)
+
+
+def read_only(array):
+    array.flags.writeable = False
+    return array
@@ -0,0 +1,113 @@
+import argparse
+import json
+import sys
+from timeit import default_timer as timer
+
+from .env2d import Environment
+
+
+# Runs an environment without the graphical interface: no pygame, no rendering and no sleeping
+def run_headless(ticks=None, seconds=None, seed=None, manual_agents=0, autonomous_agents=10,
+                 profile=False, checkpoint=None, save=None, spike_log=None, event_driven=False,
+                 vision=False):
+    # Build an environment and run it for the given number of ticks or until the wall-clock
+    # budget is used up. Returns the summary metrics of the run, with the per phase timings of
+    # the iterations if profile is set.
+    # With checkpoint the environment is restored from that checkpoint directory instead of built
+    # (the seed then only replaces its random generator), with save it is checkpointed at the end.
+    # With spike_log the spikes of all agents are recorded to that directory, see lib/spikelog.py.
+    # event_driven steps the interneurons event driven, see LIFPopulation, vision gives the
+    # autonomous agents ray-cast vision, see lib/vision.py
+    if ticks is None and seconds is None:
+        raise ValueError("a number of ticks or a time budget is needed")
+
+    if checkpoint is None:
+        env = Environment(seed, manual_agents, autonomous_agents, event_driven=event_driven,
+                          vision=vision)
+    else:
+        env = Environment.restore(checkpoint, seed)
+    env.profiler.enabled = profile
+    if spike_log is not None:
+        env.record_spikes(spike_log)
+    start = timer()
+    done = env.run_for(ticks, seconds)
+    elapsed = timer() - start
+    env.stop_recording()
+
+    if save is not None:
+        env.checkpoint(save)
+
+    metrics = env.metrics()
+    metrics["seed"] = seed
+    metrics["elapsed"] = elapsed
+    metrics["ticks_per_second"] = done / elapsed if elapsed > 0 else float("inf")
+    return metrics
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run a spyke environment without the GUI")
+    parser.add_argument("-n", "--ticks", type=int, help="number of iterations to run")
+    parser.add_argument("-t", "--seconds", type=float, help="wall-clock budget in seconds")
+    parser.add_argument("-s", "--seed", type=int, help="seed of the environment")
+    parser.add_argument("--manual", type=int, default=0, help="number of manual agents")
+    parser.add_argument("--autonomous", type=int, default=10, help="number of autonomous agents")
+    parser.add_argument("-p", "--profile", action="store_true",
+                        help="time the phases of every iteration and add them to the metrics")
+    parser.add_argument("-o", "--out", help="file to write the metrics to, stdout if not given")
+    parser.add_argument("-c", "--checkpoint",
+                        help="start from this environment checkpoint instead of a new environment")
+    parser.add_argument("--save", help="write a checkpoint of the environment to this directory "
+                                       "at the end, only for a single run")
+    parser.add_argument("--spike-log", help="record the spikes of all agents to this directory, "
+                                            "only for a single run")
+    parser.add_argument("-e", "--event-driven", action="store_true",
+                        help="only step the neurons that received input, for sparse activity")
+    parser.add_argument("--vision", action="store_true",
+                        help="let the autonomous agents see food and each other")
+    parser.add_argument("-r", "--runs", type=int, default=1,
+                        help="number of independent runs, each with its own seed")
+    parser.add_argument("-w", "--workers", type=int,
+                        help="number of worker processes for several runs, all cores by default")
+    args = parser.parse_args(argv)
+    if args.ticks is None and args.seconds is None:
+        parser.error("at least one of --ticks and --seconds is required")
+    return args
+
+
+def write_metrics(metrics, path=None):
+    text = json.dumps(metrics, indent=2)
+    if path is None:
+        print(text)
+    else:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.runs == 1:
+        metrics = run_headless(args.ticks, args.seconds, args.seed, args.manual, args.autonomous,
+                               args.profile, args.checkpoint, args.save, args.spike_log,
+                               args.event_driven, args.vision)
+        write_metrics(metrics, args.out)
+        return
+
+    # several runs are distributed over worker processes, the metrics of every run are written
+    # as one json line as soon as it finishes
+    from .ensemble import Ensemble
+
+    out = sys.stdout if args.out is None else open(args.out, "w")
+    with Ensemble(args.workers) as ensemble:
+        for metrics in ensemble.sweep(
+                args.runs, args.seed, ticks=args.ticks, seconds=args.seconds,
+                manual_agents=args.manual, autonomous_agents=args.autonomous,
+                profile=args.profile, checkpoint=args.checkpoint,
+                event_driven=args.event_driven, vision=args.vision):
+            out.write(json.dumps(metrics) + "\n")
+            out.flush()
+    if out is not sys.stdout:
+        out.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,62 @@
+import math
+import time
+from timeit import default_timer as timer
+
+
+# Pacing of a simulation loop with a fixed timestep.
+# Elapsed wall time is collected in an accumulator and every 1 / target_freq seconds of it pay for
+# one tick. As ticks are counted from the clock and not from how long the last sleep took, the
+# granularity of time.sleep only shifts single ticks a little and the average rate stays exact.
+# When the loop falls behind, for example after a slow tick, several ticks are run per wake-up
+# (at most max_batch). In catch-up mode the missed ticks are all made up, at most max_backlog
+# seconds of them, otherwise the backlog is dropped and the simulation just runs slower for a
+# moment. With target_freq None it runs as fast as possible.
+class Scheduler():
+    def __init__(self, target_freq=50, catch_up=True, max_batch=10, max_backlog=1.0,
+                 time_constant=0.5):
+        self.target_freq = target_freq  # ticks per second, None for as fast as possible
+        self.catch_up = catch_up
+        self.max_batch = max_batch
+        self.max_backlog = max_backlog  # seconds
+        self.time_constant = time_constant  # of the smoothing of the achieved rate, in seconds
+        self.rate = 0.  # achieved ticks per second, smoothed
+        self.start()
+
+    def start(self):
+        # call when the loop (re)starts, time spent stopped is not made up
+        self.last = self.last_due = timer()
+        self.accumulator = 0.
+
+    def wait_time(self):
+        # seconds until the next tick is due
+        if self.target_freq is None: return 0.
+        return max(1 / self.target_freq - self.accumulator - (timer() - self.last), 0.)
+
+    def wait(self):
+        time.sleep(self.wait_time())
+
+    def due(self):
+        # number of ticks to run now, 0 if it is too early for the next one
+        now = timer()
+        self.accumulator += now - self.last
+        self.last = now
+        if self.target_freq is None:
+            n = 1
+            self.accumulator = 0.
+        else:
+            period = 1 / self.target_freq
+            n = min(int(self.accumulator / period), self.max_batch)
+            self.accumulator -= n * period
+            backlog = self.max_backlog if self.catch_up else period
+            self.accumulator = min(self.accumulator, backlog)
+        if n:
+            self.measure(n, now)
+        return n
+
+    def measure(self, n, now):
+        # exponential moving average over time of the rate, independent of the tick rate itself
+        elapsed = now - self.last_due
+        self.last_due = now
+        if elapsed <= 0: return
+        alpha = 1 - math.exp(-elapsed / self.time_constant)
+        self.rate += alpha * (n / elapsed - self.rate)
@@ -0,0 +1,106 @@
+import json
+import os
+
+import numpy as np
+
+from . import neurons
+from .connectome import Connectome
+
+# Binary snapshots of networks.
+#
+# A snapshot is a directory holding one raw .npy file per array and a small meta.json:
+#   meta.json                    format version, neuron counts, neuron classes,
+#                                dna of the growing neurons
+#   indptr.npy, post.npy,        the connectome in compressed column form with neuron codes as rows,
+#   weight.npy                   see Connectome.from_arrays
+#   threshold.npy, leak.npy,     parameters and state of the interneurons, see LIFPopulation
+#   axon_length.npy, activation.npy, axon_angle.npy
+#   input_period.npy             exp_spike_period of the random input neurons, nan for other inputs
+#   event_delay.npy,             spikes still travelling: iterations until arrival and neuron code
+#   event_code.npy
+# Arrays are opened memory-mapped and copy-on-write, so even very big connectomes open instantly,
+# are only paged in when their synapses are used, and the snapshot on disk is never modified.
+
+FORMAT_VERSION = 1
+
+
+def save_array(path, name, array):
+    np.save(os.path.join(path, name + ".npy"), np.ascontiguousarray(array))
+
+
+def load_array(path, name):
+    return np.load(os.path.join(path, name + ".npy"), mmap_mode="c")
+
+
+def save_network(network, path):
+    os.makedirs(path, exist_ok=True)
+    clock = network.agent.env.internal_clock
+
+    indptr, post, weight = network.connectome.to_arrays()
+    save_array(path, "indptr", indptr)
+    save_array(path, "post", post)
+    save_array(path, "weight", weight)
+
+    population = network.population
+    population.settle(clock)  # event driven activations may be stale
+    for name in neurons.LIFPopulation.fields:
+        save_array(path, name, getattr(population, name)[:population.count])
+    save_array(path, "axon_angle", np.array([n.axon_angle for n in network.interneurons], float))
+    save_array(path, "input_period", np.array(
+        [getattr(n, "exp_spike_period", np.nan) for n in network.inputs], dtype=float))
+
+    times, codes = network.future_queue.pending(clock)
+    save_array(path, "event_delay", times - clock)
+    save_array(path, "event_code", codes)
+
+    meta = {
+        "format": FORMAT_VERSION,
+        "neuron_count": network.neuron_count,
+        "inputs": [type(n).__name__ for n in network.inputs],
+        "interneurons": [type(n).__name__ for n in network.interneurons],
+        "dna": {i: n.dna for i, n in enumerate(network.interneurons) if hasattr(n, "dna")},
+    }
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def load_network(network, path):
+    # replace all input and interneurons of the network by the ones in the snapshot,
+    # the outputs stay as they are, since they are the actions of the agent
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    if meta["format"] != FORMAT_VERSION:
+        raise ValueError("unsupported network snapshot format " + str(meta["format"]))
+    if meta["neuron_count"][1] != network.neuron_count[1]:
+        raise ValueError("the snapshot has a different number of outputs than the agent")
+
+    network.clear()
+
+    # recreate the neuron objects, they are views into the arrays loaded below
+    periods = load_array(path, "input_period")
+    for i, name in enumerate(meta["inputs"]):
+        neuron = getattr(neurons, name)(network)
+        if not np.isnan(periods[i]):
+            neuron.exp_spike_period = periods[i]
+        network.add_neuron(neuron)
+    angles = load_array(path, "axon_angle")
+    for i, name in enumerate(meta["interneurons"]):
+        if name == "GrowingNeuron":
+            neuron = neurons.GrowingNeuron(network, meta["dna"][str(i)])
+        else:
+            neuron = getattr(neurons, name)(network)
+        neuron.axon_angle = angles[i]
+        network.add_neuron(neuron)
+
+    population = network.population
+    for name in neurons.LIFPopulation.fields:
+        setattr(population, name, load_array(path, name))
+    population.capacity = population.count
+
+    network.set_connectome(Connectome.from_arrays(
+        network.neuron_count,
+        load_array(path, "indptr"), load_array(path, "post"), load_array(path, "weight")))
+
+    clock = network.agent.env.internal_clock
+    delays, codes = load_array(path, "event_delay"), load_array(path, "event_code")
+    network.future_queue.push(clock + np.asarray(delays), np.asarray(codes), clock)
@@ -0,0 +1,100 @@
+import numpy as np
+
+
+# Uniform grid spatial index over a set of points in the environment.
+# The points are bucketed into square cells by sorting them on their cell key, after which pairs of
+# points in the same or neighbouring cells can be enumerated with array operations only.
+# If the cell size is at least the largest interaction distance, every interacting pair is found.
+class SpatialGrid():
+
+    # half of the 3x3 neighbourhood, so that each pair of neighbouring cells is visited only once
+    half_neighbourhood = ((1, 0), (0, 1), (1, 1), (1, -1))
+
+    def __init__(self, size, cell_size=1.0):
+        self.size = np.asarray(size, dtype=float)
+        self.cell_size = cell_size
+
+        self.order = np.zeros(0, dtype=np.intp)  # point indices sorted by cell
+        self.cell_keys = np.zeros(0, dtype=np.int64)  # keys of all non empty cells, sorted
+        self.cell_start = np.zeros(0, dtype=np.intp)  # start of each cell's points in self.order
+        self.cell_count = np.zeros(0, dtype=np.intp)  # number of points in each cell
+
+    def set_cell_size(self, cell_size):
+        self.cell_size = max(float(cell_size), 1e-9)
+        # cells are padded by one on every side so neighbour keys never wrap around
+        self.shape = (np.floor(self.size / self.cell_size).astype(np.int64) + 3)
+
+    def cell_coords(self, positions):
+        cells = np.floor(positions / self.cell_size).astype(np.int64) + 1
+        return np.clip(cells, 0, self.shape - 1)
+
+    def key(self, cells):
+        return cells[..., 0] * self.shape[1] + cells[..., 1]
+
+    def build(self, positions, cell_size=None):
+        # (re)build the index from an array of positions with shape (n, 2)
+        if cell_size is not None or not hasattr(self, "shape"):
+            self.set_cell_size(self.cell_size if cell_size is None else cell_size)
+
+        keys = self.key(self.cell_coords(positions))
+        self.order = np.argsort(keys, kind="stable")
+        self.cell_keys, self.cell_start, self.cell_count = np.unique(
+            keys[self.order], return_index=True, return_counts=True)
+
+    def find_cells(self, keys):
+        # index of each key in self.cell_keys, -1 if the cell is empty
+        if len(self.cell_keys) == 0:
+            return np.full(len(keys), -1)
+        idx = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+        return np.where(self.cell_keys[idx] == keys, idx, -1)
+
+    @staticmethod
+    def cross(start_a, count_a, start_b, count_b):
+        # all combinations of the elements of cell a with the elements of cell b, for many cell
+        # pairs at once. Returns positions into self.order
+        per_pair = count_a * count_b
+        total = per_pair.sum()
+        block = np.repeat(np.arange(len(per_pair)), per_pair)
+        local = np.arange(total) - np.repeat(np.cumsum(per_pair) - per_pair, per_pair)
+        return (start_a[block] + local // count_b[block],
+                start_b[block] + local % count_b[block])
+
+    def candidate_pairs(self):
+        # Returns two index arrays (i, j) of all pairs of points that share a cell or lie in
+        # neighbouring cells. Every unordered pair is reported once
+        start, count = self.cell_start, self.cell_count
+
+        # pairs within the same cell
+        a, b = SpatialGrid.cross(start, count, start, count)
+        keep = a < b
+        first, second = [a[keep]], [b[keep]]
+
+        # pairs between neighbouring cells
+        cx, cy = np.divmod(self.cell_keys, self.shape[1])
+        for dx, dy in SpatialGrid.half_neighbourhood:
+            other = self.find_cells((cx + dx) * self.shape[1] + cy + dy)
+            has = other >= 0
+            a, b = SpatialGrid.cross(start[has], count[has], start[other[has]], count[other[has]])
+            first.append(a)
+            second.append(b)
+
+        return self.order[np.concatenate(first)], self.order[np.concatenate(second)]
+
+    def query(self, positions, radius):
+        # Returns index arrays (q, p) of query positions and indexed points whose cells are within
+        # radius of each other. Candidates still have to be checked for their actual distance
+        reach = int(np.ceil(radius / self.cell_size))
+        cells = self.cell_coords(np.asarray(positions, dtype=float))
+        queries, points = [], []
+        for dx in range(-reach, reach + 1):
+            for dy in range(-reach, reach + 1):
+                neighbours = cells + (dx, dy)
+                inside = np.all((neighbours >= 0) & (neighbours < self.shape), axis=1)
+                found = np.where(inside, self.find_cells(self.key(neighbours)), -1)
+                has = np.nonzero(found >= 0)[0]
+                q, p = SpatialGrid.cross(
+                    has, np.ones(len(has), dtype=np.intp),
+                    self.cell_start[found[has]], self.cell_count[found[has]])
+                queries.append(q)
+                points.append(self.order[p])
+        return np.concatenate(queries), np.concatenate(points)
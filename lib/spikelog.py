@@ -0,0 +1,114 @@
+import os
+import re
+
+import numpy as np
+
+# Append-only, columnar log of the spikes of all agents of an environment.
+#
+# Every spike is a row (tick, agent, neuron). agent is the id of the agent, neuron the code of the
+# neuron in its network: interneuron i has the code i, input neuron i the code -1 - i
+# (see lib/connectome.py). Rows are collected in fixed size in-memory buffers, whenever they are
+# full they are written to disk as one segment: a .npy file per column,
+#   <column>_<segment number>.npy
+# Segments are written to a temporary name first and renamed when complete, so a reader never sees
+# a partially written segment, even while the simulation is still running.
+
+COLUMNS = (("tick", np.int64), ("agent", np.int32), ("neuron", np.int32))
+
+
+class SpikeLog():
+    def __init__(self, path, chunk_size=1 << 16):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.chunk_size = chunk_size
+        self.buffers = {name: np.zeros(chunk_size, dtype=dtype) for name, dtype in COLUMNS}
+        self.fill = 0
+        self.segments = len(SpikeLogReader.segment_numbers(path))  # continue an existing log
+        self.written = 0  # number of rows written to disk so far
+
+    def __len__(self):
+        return self.written + self.fill
+
+    def append(self, tick, agent, neuron):
+        # append rows, every argument is a single value or an array of the same length
+        neuron = np.atleast_1d(neuron)
+        n = len(neuron)
+        done = 0
+        while done < n:
+            k = min(n - done, self.chunk_size - self.fill)
+            for name, values in (("tick", tick), ("agent", agent), ("neuron", neuron)):
+                values = values if np.ndim(values) == 0 else values[done:done + k]
+                self.buffers[name][self.fill:self.fill + k] = values
+            self.fill += k
+            done += k
+            if self.fill == self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        # write the buffered rows as a new segment
+        if self.fill == 0: return
+        for name, dtype in COLUMNS:
+            file = os.path.join(self.path, f"{name}_{self.segments:06d}.npy")
+            with open(file + ".tmp", "wb") as f:
+                np.save(f, self.buffers[name][:self.fill])
+            os.replace(file + ".tmp", file)
+        self.segments += 1
+        self.written += self.fill
+        self.fill = 0
+
+    def close(self):
+        self.flush()
+
+
+class SpikeLogReader():
+    # Offline access to a spike log. Segments are memory-mapped, so logs larger than the memory can
+    # be analysed and only the parts that are read are loaded
+    def __init__(self, path):
+        self.path = path
+        self.refresh()
+
+    @staticmethod
+    def segment_numbers(path):
+        # numbers of the complete segments, a segment is complete when all its columns exist
+        names = os.listdir(path) if os.path.isdir(path) else []
+        found = {}
+        for name in names:
+            match = re.fullmatch(r"(\w+?)_(\d+)\.npy", name)
+            if match:
+                found.setdefault(int(match.group(2)), set()).add(match.group(1))
+        columns = {name for name, dtype in COLUMNS}
+        return sorted(k for k, names in found.items() if names >= columns)
+
+    def refresh(self):
+        # pick up segments written since the reader was opened
+        self.segments = [
+            {name: np.load(os.path.join(self.path, f"{name}_{k:06d}.npy"), mmap_mode="r")
+             for name, dtype in COLUMNS}
+            for k in SpikeLogReader.segment_numbers(self.path)]
+
+    def __len__(self):
+        return sum(len(segment["tick"]) for segment in self.segments)
+
+    def column(self, name):
+        # a whole column over all segments, this copies it into memory
+        return np.concatenate([segment[name] for segment in self.segments]
+                              + [np.zeros(0, dtype=dict(COLUMNS)[name])])
+
+    def raster(self, agent=None, start=None, end=None):
+        # Spikes with start <= tick < end, of one agent or all of them, as (ticks, agents, neurons).
+        # Segments are in tick order, so segments outside the range are skipped without reading
+        # more than their first and last tick
+        result = [[], [], []]
+        for segment in self.segments:
+            ticks = segment["tick"]
+            if len(ticks) == 0: continue
+            if (start is not None and ticks[-1] < start) or (end is not None and ticks[0] >= end):
+                continue
+            keep = np.ones(len(ticks), dtype=bool)
+            if start is not None: keep &= ticks >= start
+            if end is not None: keep &= ticks < end
+            if agent is not None: keep &= segment["agent"] == agent
+            for i, (name, dtype) in enumerate(COLUMNS):
+                result[i].append(segment[name][keep])
+        return tuple(np.concatenate(columns + [np.zeros(0, dtype=dtype)])
+                     for columns, (name, dtype) in zip(result, COLUMNS))
@@ -8,15 +8,18 @@ def pol2cart(rho, phi):
 
 
 def divide_line(Apos, Bpos, n):
-    result = np.zeros((n, 2))
+    # n points evenly spaced between A and B, shape (n, 2)
     inter_dist_vec = (Bpos - Apos) / (n + 1)
-    for i in range(n):
-        result[i, 0] = Apos[0] + (i + 1) * inter_dist_vec[0]
-        result[i, 1] = Apos[1] + (i + 1) * inter_dist_vec[1]
-    return result
+    return Apos + np.arange(1, n + 1)[:, None] * inter_dist_vec
 
 
 def rotate(vec, alpha):
     Mrot = np.array([[np.cos(alpha), -np.sin(alpha)],
                     [np.sin(alpha), np.cos(alpha)]])
     return np.dot(Mrot, vec)
+
+
+def rotate_many(vecs, alphas):
+    # rotate every row of vecs (n, 2) by its own angle
+    cos, sin = np.cos(alphas), np.sin(alphas)
+    return np.stack((cos * vecs[:, 0] - sin * vecs[:, 1], sin * vecs[:, 0] + cos * vecs[:, 1]), 1)
@@ -0,0 +1,139 @@
+import math
+
+import numpy as np
+
+from .inputs import InputSource
+from .spatial2d import SpatialGrid
+
+
+# Vision of the agents, as a source of input spikes (see lib/inputs.py).
+#
+# Every seeing agent casts a fan of rays, spread evenly over the field of view around its heading.
+# For each ray and each kind of target (food and other agents) the agent has a VisionNeuron, which
+# spikes with a probability that grows the closer the nearest hit along its ray is:
+#   p = max_rate * (1 - distance / view_distance), 0 if nothing is hit within view_distance.
+# The vision neurons are connected to the outputs, so the agent steers towards the food it sees and
+# away from other agents (see steer). Vision is enabled per environment, its spikes feed the
+# networks but are not counted in env.spike_count.
+# The rays of all agents are cast together. The targets near each agent are found with a spatial
+# grid whose cells are as large as the view distance, then every ray is intersected with every
+# candidate circle at once and the nearest hit per ray is kept.
+# The grids are rebuilt every iteration, as the agents and the food move. With only a few agents
+# and targets all pairs are checked instead, which is cheaper than building and querying a grid.
+class Vision(InputSource):
+    targets = ("food", "agents")
+    # up to this many (agent, target) pairs no grid is used
+    all_pairs = 4096
+    counted = False
+
+    def __init__(self, env, rays=5, field_of_view=math.radians(90), view_distance=150,
+                 max_rate=0.5):
+        self.rays = rays
+        self.field_of_view = field_of_view
+        self.view_distance = view_distance
+        self.max_rate = max_rate  # spike probability per iteration of a neuron seeing a target
+        self.food_grid = SpatialGrid(env.size)
+        self.agent_grid = SpatialGrid(env.size)
+        super().__init__(env)
+
+    def attach(self, network):
+        # give the agent of a network eyes: a vision neuron per ray and target, connected to the
+        # output of the action it triggers
+        from .neurons import VisionNeuron
+        outputs = {output.action.__name__: i for i, output in enumerate(network.outputs)}
+        for target in Vision.targets:
+            for offset in self.offsets():
+                neuron = VisionNeuron(network)
+                network.add_neuron(neuron)
+                network.connectome[outputs[self.steer(target, offset)], neuron.id[1]] = 1
+
+    @staticmethod
+    def steer(target, offset):
+        # action of seeing a target along a ray at the given angle from the heading
+        if target == "food":
+            if offset == 0: return "move"
+            return "turn_right" if offset > 0 else "turn_left"
+        return "turn_left" if offset > 0 else "turn_right"
+
+    def offsets(self):
+        # angles of the rays relative to the heading
+        if self.rays == 1:
+            return np.zeros(1)
+        return np.linspace(-self.field_of_view / 2, self.field_of_view / 2, self.rays)
+
+    def rebuild(self):
+        super().rebuild()
+        ray = np.array([n.ray for n in self.neurons], dtype=np.int64)
+        target = np.array([n.target for n in self.neurons], dtype=np.int64)
+        # the agents that see and the slot of every neuron in the (agent, target, ray) results
+        self.seers, seer = np.unique(self.agent_id, return_inverse=True)
+        self.slot = (seer * len(Vision.targets) + target) * self.rays + ray
+        self.valid = (ray < self.rays) & (target < len(Vision.targets))
+
+    def candidates(self, grid, origins, points, reach):
+        # pairs of seers and points that may be within reach of each other
+        if len(origins) * len(points) <= Vision.all_pairs:
+            seer, target = np.divmod(np.arange(len(origins) * len(points)), len(points))
+            return seer, target
+        grid.build(points, reach)
+        return grid.query(origins, reach)
+
+    def cast(self, origins, headings, directions, seer, centers, radii):
+        # Distance along every ray of the seers to the nearest of the candidate circles.
+        # seer[k] is the seer and centers[k], radii[k] the circle of candidate pair k.
+        # Returns an array (number of seers, rays), inf where nothing is hit
+        nearest = np.full((len(origins), self.rays), np.inf)
+        # only circles within view distance and at least partly inside the field of view can be hit
+        w = centers - origins[seer]
+        d2 = np.einsum("kj,kj->k", w, w)
+        near = d2 <= (self.view_distance + radii) ** 2
+        seer, w, d2, radii = seer[near], w[near], d2[near], radii[near]
+        d = np.sqrt(d2)
+        bearing = np.einsum("kj,kj->k", w, headings[seer])  # d * cos(angle off the heading)
+        half_width = np.arcsin(np.minimum(radii / np.maximum(d, 1e-9), 1))  # angular radius
+        spread = np.minimum(self.field_of_view / 2 + half_width, np.pi)
+        seen = (bearing >= d * np.cos(spread)) | (d <= radii)
+        seer, w, d2, radii = seer[seen], w[seen], d2[seen], radii[seen]
+        if len(seer) == 0:
+            return nearest
+
+        along = np.einsum("kj,krj->kr", w, directions[seer])  # distance to the closest approach
+        inside = radii[:, None] ** 2 - (d2[:, None] - along ** 2)  # > 0 if the ray hits
+        k, ray = np.nonzero((inside >= 0) & (along >= 0))
+        hit = np.maximum(along[k, ray] - np.sqrt(inside[k, ray]), 0.0)
+        close = hit <= self.view_distance
+        np.minimum.at(nearest, (seer[k[close]], ray[close]), hit[close])
+        return nearest
+
+    def fire(self, clock):
+        if len(self.neurons) == 0:
+            return np.zeros(0, dtype=np.int64)
+        env = self.env
+        pop = env.population
+        origins, angles = pop.pos[self.seers], pop.angle[self.seers]
+        headings = np.stack((np.cos(angles), np.sin(angles)), axis=1)
+        rays = angles[:, None] + self.offsets()
+        directions = np.stack((np.cos(rays), np.sin(rays)), axis=2)  # (seers, rays, 2)
+
+        # food
+        food = env.food.active
+        reach = self.view_distance + env.food_radius
+        seer, target = self.candidates(self.food_grid, origins, food, reach)
+        radii = np.full(len(target), float(env.food_radius))
+        food_hits = self.cast(origins, headings, directions, seer, food[target], radii)
+
+        # other agents
+        n = pop.count
+        reach = self.view_distance + pop.radius[:n].max()
+        seer, target = self.candidates(self.agent_grid, origins, pop.pos[:n], reach)
+        other = target != self.seers[seer]
+        seer, target = seer[other], target[other]
+        agent_hits = self.cast(
+            origins, headings, directions, seer, pop.pos[target], pop.radius[target])
+
+        # spike probabilities in the slots of the neurons, one draw for all of them
+        distance = np.stack((food_hits, agent_hits), axis=1).ravel()
+        intensity = np.where(np.isfinite(distance), 1 - distance / self.view_distance, 0.0)
+        slot = np.minimum(self.slot, len(distance) - 1)
+        p = np.where(self.valid, self.max_rate * intensity[slot], 0.0)
+        return np.nonzero(env.rng.random(len(p)) < p)[0]
@@ -1,3 +1,5 @@
+import argparse
+
 import pygame
 import pygame_gui
 
@@ -8,7 +10,7 @@ import gui
 
 class Interface():
 
-    def __init__(self):
+    def __init__(self, process=False):
         # Static Variables
         self.win_size = (1920, 1018)
         self.fps = 30
@@ -16,6 +18,7 @@ class Interface():
         self.padding = 15   # gap between gui elements
         self.button_height = 30  # height of buttons, selectors, sliders, etc.
         self.button_width = 60  # width of buttons only
+        self.process = process  # simulate in a child process instead of a thread
 
         # Initialize graphical interface
         pygame.init()
@@ -40,8 +43,7 @@ class Interface():
         # TODO stop & save env if running
         self.running = False
         if self.env_win:
-            if self.env_win.env.running:
-                self.env_win.env.running = False
+            self.env_win.env.close()
         pygame.quit()
 
     def open_env_win(self):
@@ -75,11 +77,12 @@ class Interface():
                 if event.ui_element.ui_container == self.env_control_win.get_container():
                     self.env_control_win.handle(event)
 
+                if event.ui_element.ui_container == self.stats_win.get_container():
+                    self.stats_win.handle(event)
+
                 if self.agent_win:
                     if event.ui_element.ui_container == self.agent_win.get_container():
-                        if event.user_type == pygame_gui.UI_BUTTON_PRESSED:
-                            if event.ui_element == self.agent_win.show_button:
-                                self.open_net_win(self.agent_win.agent)
+                        self.agent_win.handle(event)
 
                 if self.net_win:
                     if event.ui_element.ui_container == self.net_win._window_root_container:
@@ -99,14 +102,15 @@ class Interface():
                     scale = self.env_win.env.size[0] / self.env_win.scaled_surface.get_width()
                     mpos = (mpos - np.array((env_rect.left, env_rect.top))) * scale
 
-                    # iterate through agents, check if one was clicked, if yes select it
+                    # check if an agent was clicked, if yes select it. The published frame is
+                    # used, as the simulation thread may be moving the agents meanwhile
                     old_select = self.env_win.selected_agent
-                    for a in self.env_win.env.agents:
-                        dist = np.linalg.norm(a.pos - mpos)
-                        if dist <= a.radius:
-                            self.env_win.selected_agent = a.id
-                            if self.agent_win: self.agent_win.kill()
-                            self.agent_win = gui.AgentWin(self, a.id)
+                    clicked = self.env_win.env.frame.agent_at(mpos)
+                    if clicked is not None:
+                        self.env_win.selected_agent = clicked
+                        if self.agent_win: self.agent_win.kill()
+                        if not self.env_win.remote:
+                            self.agent_win = gui.AgentWin(self, clicked)
 
                     # if selection not changed, deselect
                     if self.env_win.selected_agent == old_select:
@@ -141,5 +145,9 @@ class Interface():
 
 
 if __name__ == '__main__':
-    app = Interface()
+    parser = argparse.ArgumentParser(description="Spyke")
+    parser.add_argument("--process", action="store_true",
+                        help="run the simulation in a child process instead of a thread")
+    args = parser.parse_args()
+    app = Interface(args.process)
     app.run()
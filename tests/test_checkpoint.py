@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from lib.env2d import Environment
+from test_networks import mutate
+
+
+def same_state(a, b):
+    n = a.population.count
+    return (a.internal_clock == b.internal_clock and a.spike_count == b.spike_count
+            and np.array_equal(a.population.pos[:n], b.population.pos[:n]))
+
+
+@pytest.mark.parametrize("event_driven", [False, True])
+def test_restored_environment_continues_exactly(tmp_path, event_driven):
+    env = Environment(5, manual_agents=1, autonomous_agents=10, event_driven=event_driven)
+    rng = np.random.default_rng(2)
+    for t in range(50):
+        env.next()
+        mutate(env, rng)
+    env.checkpoint(tmp_path / "ckpt")
+    restored = Environment.restore(tmp_path / "ckpt")
+    assert same_state(env, restored)
+
+    rng_env, rng_restored = np.random.default_rng(9), np.random.default_rng(9)
+    for t in range(150):
+        env.next()
+        restored.next()
+        mutate(env, rng_env)
+        mutate(restored, rng_restored)
+    assert same_state(env, restored)
+
+
+def test_checkpoint_does_not_change_the_run(tmp_path):
+    plain = Environment(5)
+    plain.step(300)
+    saved = Environment(5)
+    saved.step(150)
+    saved.checkpoint(tmp_path / "ckpt")
+    saved.step(150)
+    assert same_state(plain, saved)
+
+
+def test_forked_branches_share_the_future(tmp_path):
+    env = Environment(1, autonomous_agents=5)
+    env.step(30)
+    branches = env.fork(tmp_path / "ckpt", 2)
+    env.step(100)
+    for branch in branches:
+        branch.step(100)
+        assert same_state(env, branch)
+
+    seeded = Environment.restore(tmp_path / "ckpt", seed=1), \
+        Environment.restore(tmp_path / "ckpt", seed=2)
+    for branch in seeded:
+        branch.step(100)
+    assert not same_state(*seeded)
+
+
+def test_restore_without_agents_can_add_agents(tmp_path):
+    Environment(1, manual_agents=0, autonomous_agents=0).checkpoint(tmp_path / "ckpt")
+    env = Environment.restore(tmp_path / "ckpt")
+    env.add_agent("autonomous")
+    env.add_agent("manual")
+    env.step(3)
+    assert env.population.count == 2
@@ -0,0 +1,33 @@
+import numpy as np
+
+from lib.connectome import Connectome
+
+
+def test_connectome_matches_dense_matrix():
+    rng = np.random.default_rng(0)
+    connectome = Connectome(3, 2, 6)
+    dense = np.zeros(connectome.shape)
+    for i in range(3000):
+        row, col = rng.integers(connectome.shape[0]), rng.integers(connectome.shape[1])
+        weight = rng.choice([0, 0, 1.5, -2])
+        connectome[row, col] = dense[row, col] = weight
+        assert connectome[row, col] == weight
+    assert np.array_equal(connectome.toarray(), dense)
+    assert connectome.nnz == np.count_nonzero(dense)
+
+    # the same from a snapshot in compressed column form
+    loaded = Connectome.from_arrays(connectome.neuron_count, *connectome.to_arrays())
+    for i in range(1000):
+        row, col = rng.integers(loaded.shape[0]), rng.integers(loaded.shape[1])
+        loaded[row, col] = dense[row, col] = rng.choice([0, 1.0])
+    assert np.array_equal(loaded.toarray(), dense)
+
+
+def test_connectome_skips_writes_that_change_nothing():
+    connectome = Connectome(2, 2, 2)
+    events = []
+    connectome.on_change = lambda *event: events.append(event)
+    connectome[0, 0] = 0
+    connectome[1, 1] = 1
+    connectome[1, 1] = 1
+    assert events == [("synapse", -2, -2, 1)]
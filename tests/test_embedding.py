@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+import pytest
+
+from bench.suite import build_network, grow_network
+from lib import neurons
+from lib.embedding import Embedding
+
+
+def layout(embedding):
+    # dendrites sorted by their neurons, as their order within a column is not fixed
+    order = np.lexsort((embedding.dendrite_post, embedding.dendrite_pre))
+    return (embedding.neuron_positions, embedding.dendrite_pre[order],
+            embedding.dendrite_post[order], embedding.dendrite_positions[order])
+
+
+def test_incremental_update_matches_full_compute():
+    env, net = build_network(30)
+    embedding = Embedding(net)
+    embedding.compute()
+    rng = np.random.default_rng(4)
+
+    for step in range(5):
+        n_out, n_in = net.neuron_count[1], net.neuron_count[0]
+        for i in range(10):
+            post, pre = rng.integers(net.neuron_count[2], size=2)
+            net.connectome[n_out + post, n_in + pre] = rng.choice([0, 0.5])
+        if step % 2:
+            grow_network(net, 3, 2, rng)
+        if step == 3:
+            net.add_neuron(neurons.Neuron_random(net))
+        assert embedding.update()
+
+        full = Embedding(net)
+        full.compute()
+        for incremental, expected in zip(layout(embedding), layout(full)):
+            assert np.allclose(incremental, expected)
+        assert np.array_equal(embedding.dendrite_offsets, full.dendrite_offsets)
+        cols = net.connectome.pre_col(embedding.dendrite_pre)
+        assert all((cols[embedding.dendrites_of(col)] == col).all()
+                   for col in range(net.connectome.shape[1]))
+        full.close()
+    embedding.close()
+    assert embedding.topology_changed not in net.listeners
+
+
+def test_added_dendrites_are_drawn_on_top():
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame = pytest.importorskip("pygame")
+    env, net = build_network(30)
+    embedding = Embedding(net, pygame.Surface((500, 500)))
+    embedding.compute()
+    embedding.draw()
+    n_out, n_in = net.neuron_count[1], net.neuron_count[0]
+
+    # new synapses only, the drawing is not redone
+    net.connectome[n_out + 3, n_in + 7] = 0.5
+    net.connectome[n_out + 12, 0] = 0.5  # from an input
+    assert embedding.update() and not embedding.stale
+    embedding.draw_changes()
+    full = Embedding(net, pygame.Surface((500, 500)))
+    full.compute()
+    full.draw()
+    assert pygame.image.tobytes(embedding.surface, "RGB") == \
+        pygame.image.tobytes(full.surface, "RGB")
+
+    # removing one is drawn from scratch
+    net.connectome[n_out + 3, n_in + 7] = 0
+    assert embedding.update() and embedding.stale
+    embedding.close()
+    full.close()
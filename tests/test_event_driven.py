@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from lib.env2d import Environment
+from test_networks import build, run
+
+
+def test_event_driven_steps_like_dense():
+    dense = run(build(True), 300)
+    event = run(build(True, event_driven=True), 300)
+    assert dense.spike_count == event.spike_count
+    n = dense.population.count
+    assert np.array_equal(dense.population.pos[:n], event.population.pos[:n])
+    for a, b in zip(dense.agents, event.agents):
+        b.network.population.settle(event.internal_clock)
+        count = a.network.population.count
+        assert np.allclose(a.network.population.activation[:count],
+                           b.network.population.activation[:count], atol=1e-12)
+
+
+def drive(env, ticks, seed=11):
+    # run while setting and exciting single neurons through their views between the ticks
+    rng = np.random.default_rng(seed)
+    autonomous = [agent for agent in env.agents if agent.type == "autonomous"]
+    for t in range(ticks):
+        env.next()
+        for i in range(2):
+            net = autonomous[rng.integers(len(autonomous))].network
+            neuron = net.interneurons[rng.integers(len(net.interneurons))]
+            r = rng.random()
+            if r < 0.4:
+                neuron.activation = rng.uniform(0, 2)
+            elif r < 0.8:
+                neuron.excite(rng.uniform(0, 1))
+            else:
+                neuron.threshold = rng.uniform(0.3, 1.2)
+    return env
+
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_neurons_set_through_views_step_like_dense(batched):
+    dense = drive(build(batched), 300)
+    event = drive(build(batched, event_driven=True), 300)
+    assert dense.spike_count == event.spike_count
+    for a, b in zip(dense.agents, event.agents):
+        b.network.population.settle(event.internal_clock)
+        count = a.network.population.count
+        assert np.allclose(a.network.population.activation[:count],
+                           b.network.population.activation[:count], atol=1e-12)
+
+
+def test_neuron_without_input_fires_after_being_set():
+    env = Environment(1, manual_agents=0, autonomous_agents=1, event_driven=True)
+    env.step(3)
+    net = env.agents[0].network
+    net.connectome[3, 0] = 0  # the only input of the interneuron
+    env.step(1)
+    net.interneurons[0].activation = 2.0
+    net.spike_tracking = True
+    env.step(50)
+    ticks, codes, cursor = net.recording.read(0)
+    assert 0 in codes.tolist()
+    net.population.settle(env.internal_clock)
+    assert net.interneurons[0].activation == 0.0
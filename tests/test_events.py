@@ -0,0 +1,38 @@
+import numpy as np
+
+from lib.events import DelayLine, SpikeRing
+
+
+def test_delay_line_delivers_in_time_order():
+    rng = np.random.default_rng(2)
+    line = DelayLine(4)
+    expected = {}
+    for now in range(200):
+        times = now + rng.integers(0, 30, 5)
+        codes = rng.integers(-5, 50, 5)
+        line.push(times, codes, now)
+        for t, c in zip(times.tolist(), codes.tolist()):
+            expected.setdefault(t, []).append(c)
+        assert sorted(line.pop(now).tolist()) == sorted(expected.pop(now, []))
+
+
+def test_spike_ring_counts_dropped_spikes_and_lag():
+    ring = SpikeRing(8)
+    ring.push(1, np.arange(5))
+    ticks, codes, cursor = ring.read(0)
+    assert codes.tolist() == [0, 1, 2, 3, 4] and ticks.tolist() == [1] * 5
+    assert ring.dropped == 0 and ring.lag == 5
+
+    # the consumer falls behind: the oldest unread spikes are overwritten
+    ring.push(2, np.arange(10, 16))
+    ring.push(3, np.arange(20, 24))
+    ticks, codes, cursor = ring.read(cursor)
+    assert ring.lag == 10 and ring.dropped == 2
+    assert codes.tolist() == [12, 13, 14, 15, 20, 21, 22, 23]
+    assert ticks.tolist() == [2] * 4 + [3] * 4
+
+    # more spikes in one push than fit
+    ring.push(4, np.arange(30, 50))
+    ticks, codes, cursor = ring.read(cursor)
+    assert codes.tolist() == list(range(42, 50)) and ring.dropped == 14
+    assert len(ring.read(cursor)[1]) == 0 and ring.lag == 0
@@ -0,0 +1,26 @@
+import numpy as np
+
+from lib.food2d import FoodStore
+
+
+def test_consume_matches_brute_force():
+    rng = np.random.default_rng(2)
+    food = FoodStore((200, 200))
+    food.spawn_random(150, rng)
+    before = food.active.copy()
+    agents = rng.uniform(0, 200, (40, 2))
+    reach = np.full(40, 8.0)
+
+    # reference: every agent reaches for the first food in the store it can reach, of several
+    # agents reaching for the same food the one with the lowest index gets it
+    winner = {}
+    for a in range(len(agents)):
+        in_reach = np.nonzero(np.linalg.norm(before - agents[a], axis=1) <= reach[a])[0]
+        if len(in_reach):
+            winner.setdefault(int(in_reach[0]), a)
+
+    ate = food.consume(agents, reach)
+    assert sorted(ate.tolist()) == sorted(winner.values())
+    eaten = np.zeros(len(before), dtype=bool)
+    eaten[list(winner)] = True
+    assert sorted(map(tuple, food.active)) == sorted(map(tuple, before[~eaten]))
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from lib import neurons
+from lib.agents2d import Agent2
+from lib.connectome import CompressedColumns
+from lib.env2d import Environment
+
+
+def build(batched, agents=12, event_driven=False, seed=3):
+    # environment whose networks are stepped as one batch, or each on its own
+    env = Environment(seed, manual_agents=0, autonomous_agents=0, event_driven=event_driven)
+    for i in range(agents):
+        if batched:
+            env.add_agent("autonomous")
+        else:
+            position = np.array((env.rng.uniform(10, env.size[0] - 10),
+                                 env.rng.uniform(10, env.size[1] - 10)))
+            env.agents.append(Agent2(position, env))
+            env.agent_count += 1
+    return env
+
+
+def mutate(env, rng):
+    # random topology changes: new neurons and synapses set, changed or removed
+    autonomous = [agent for agent in env.agents if agent.type == "autonomous"]
+    for i in range(3):
+        net = autonomous[rng.integers(len(autonomous))].network
+        r = rng.random()
+        if r < 0.2:
+            net.add_neuron(neurons.Neuron_LIF(net))
+        elif r < 0.25:
+            net.add_neuron(neurons.Neuron_random(net))
+        else:
+            c = net.connectome
+            c[rng.integers(c.shape[0]), rng.integers(c.shape[1])] = rng.choice([0, 0.5, 1.0, 2.0])
+
+
+def run(env, ticks, seed=7):
+    rng = np.random.default_rng(seed)
+    for t in range(ticks):
+        env.next()
+        mutate(env, rng)
+    return env
+
+
+def test_compressed_columns_replace():
+    rng = np.random.default_rng(1)
+    dense = (rng.random((8, 10)) < 0.3) * rng.random((8, 10))
+    rows, cols = np.nonzero(dense.T)[::-1]
+    matrix = CompressedColumns(dense.shape, rows, cols, dense[rows, cols])
+    dense[:, 3:6] = (rng.random((8, 3)) < 0.5) * rng.random((8, 3))
+    block = dense[:, 3:6]
+    rows, cols = np.nonzero(block.T)[::-1]
+    matrix.replace(3, 6, rows, cols + 3, block[rows, cols])
+    out_rows, values = matrix.propagate(np.arange(10))
+    expected = dense.sum(axis=1)
+    assert np.allclose(values, expected[out_rows])
+    assert set(out_rows.tolist()) == set(np.nonzero(expected)[0].tolist())
+
+
+@pytest.mark.parametrize("event_driven", [False, True])
+def test_batch_steps_like_single_networks(event_driven):
+    batched = run(build(True, event_driven=event_driven), 300)
+    single = run(build(False, event_driven=event_driven), 300)
+    n = batched.population.count
+    assert batched.spike_count == single.spike_count
+    assert np.allclose(batched.population.pos[:n], single.population.pos[:n], atol=1e-9)
+
+
+def test_network_without_interneurons_grows():
+    env = Environment(1, manual_agents=0, autonomous_agents=2)
+    net = env.agents[0].network
+    net.clear()
+    env.step(2)  # packed with no interneurons
+    for i in range(3):
+        net.add_neuron(neurons.Neuron_LIF(net))
+    env.step(2)
+    assert net.population.count == 3
@@ -0,0 +1,64 @@
+import math
+
+import numpy as np
+
+from lib.agents2d import Agent2
+from lib.env2d import Environment
+from lib.population2d import Population
+
+
+def reference_step(pos, vel, angle, force, mass, friction):
+    # physics of one agent, one iteration, as the agents computed it on their own
+    if force > 0:
+        vel = vel + (force / mass * math.cos(angle), force / mass * math.sin(angle))
+    if np.linalg.norm(vel) <= friction:
+        vel = np.zeros(2)
+    else:
+        vel = vel - vel / np.linalg.norm(vel) * friction
+    return pos + vel, vel, force - 1 if force >= 1 else force
+
+
+def test_population_steps_like_single_agents():
+    rng = np.random.default_rng(0)
+    population = Population(0)
+    n = 50
+    for i in range(n):
+        population.add()
+    population.pos[:n] = rng.uniform(0, 100, (n, 2))
+    population.vel[:n] = rng.normal(0, 1, (n, 2))
+    population.angle[:n] = rng.uniform(-math.pi, math.pi, n)
+    population.force[:n] = rng.integers(0, 3, n)
+    population.mass[:n] = rng.uniform(0.5, 2, n)
+    population.friction[:n] = rng.uniform(0, 0.3, n)
+    agents = [[population.pos[i].copy(), population.vel[i].copy(), population.angle[i],
+               population.force[i], population.mass[i], population.friction[i]] for i in range(n)]
+
+    for t in range(20):
+        population.next()
+        for agent in agents:
+            agent[0], agent[1], agent[3] = reference_step(*agent)
+    for i, agent in enumerate(agents):
+        assert np.allclose(population.pos[i], agent[0])
+        assert np.allclose(population.vel[i], agent[1])
+        assert population.force[i] == agent[3]
+
+
+def test_agents_are_views_of_the_population():
+    env = Environment(1, manual_agents=1, autonomous_agents=40)
+    agent = env.agents[-1]
+    agent.pos = np.array((50.0, 60.0))
+    agent.move()
+    assert np.array_equal(env.population.pos[agent.id], (50.0, 60.0))
+    assert env.population.force[agent.id] == agent.force == 1
+    env.step(1)
+    assert np.array_equal(agent.pos, env.population.pos[agent.id])
+
+
+def test_tick_has_no_per_agent_loop_for_batched_networks():
+    env = Environment(1, manual_agents=2, autonomous_agents=5)
+    assert env.solo_networks == []
+    solo = Agent2(np.array((100.0, 100.0)), env)
+    assert env.solo_networks == [solo.network]
+    solo.network.spike_tracking = True
+    env.step(200)
+    assert solo.network.recording.written > 0  # stepped on its own
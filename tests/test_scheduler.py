@@ -0,0 +1,52 @@
+import pytest
+
+from lib import scheduler
+from lib.scheduler import Scheduler
+
+
+class Clock():
+    # stands in for the wall clock of the scheduler
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler, "timer", clock)
+    return clock
+
+
+def test_ticks_are_paid_for_by_elapsed_time(clock):
+    pacer = Scheduler(target_freq=10)
+    clock.now += 0.05
+    assert pacer.due() == 0
+    assert pacer.wait_time() == pytest.approx(0.05)
+    clock.now += 0.06
+    assert pacer.due() == 1
+    clock.now += 0.35
+    assert pacer.due() == 3  # the remainders add up to a tick
+
+    # a steady rate is measured as such
+    for i in range(100):
+        clock.now += 0.1
+        pacer.due()
+    assert pacer.rate == pytest.approx(10, rel=1e-3)
+
+
+@pytest.mark.parametrize("catch_up", [False, True])
+def test_backlog_is_made_up_in_batches_or_dropped(clock, catch_up):
+    pacer = Scheduler(target_freq=8, catch_up=catch_up, max_batch=3, max_backlog=1.0)
+    clock.now += 2.0  # a slow tick
+    ticks = [pacer.due() for i in range(5)]
+    # at most max_batch per wake-up, in catch-up mode max_backlog seconds are made up
+    assert ticks == ([3, 3, 3, 2, 0] if catch_up else [3, 1, 0, 0, 0])
+
+
+def test_unthrottled_runs_every_wake_up(clock):
+    pacer = Scheduler(target_freq=None)
+    assert [pacer.due() for i in range(3)] == [1, 1, 1]
+    assert pacer.wait_time() == 0
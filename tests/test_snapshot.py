@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from bench.suite import build_network
+from lib import neurons
+from lib.agents2d import Agent2
+
+
+def test_saved_network_loads_unchanged(tmp_path):
+    env, net = build_network(40)
+    net.add_neuron(neurons.GrowingNeuron(net, "AB"))
+    net.inputs[0].exp_spike_period = 7
+    for i in range(30):
+        env.internal_clock += 1
+        net.next()
+    net.save_network(tmp_path / "net")
+
+    loaded = Agent2(np.array((50.0, 50.0)), env).network
+    loaded.load_network(tmp_path / "net")
+    assert loaded.neuron_count == net.neuron_count
+    assert np.array_equal(loaded.connectome.toarray(), net.connectome.toarray())
+    n = net.population.count
+    for name in neurons.LIFPopulation.fields:
+        assert np.array_equal(getattr(loaded.population, name)[:n],
+                              getattr(net.population, name)[:n])
+    assert [type(neuron) for neuron in loaded.interneurons] == \
+        [type(neuron) for neuron in net.interneurons]
+    assert loaded.interneurons[-1].dna == "AB"
+    assert loaded.inputs[0].exp_spike_period == 7
+
+    # spikes still travelling arrive as they would have
+    clock = env.internal_clock
+    saved, restored = net.future_queue.pending(clock), loaded.future_queue.pending(clock)
+    assert len(saved[0]) > 0
+    assert sorted(zip(*map(list, saved))) == sorted(zip(*map(list, restored)))
+
+
+def test_snapshot_with_other_outputs_is_refused(tmp_path):
+    env, net = build_network(5)
+    net.save_network(tmp_path / "net")
+    other = Agent2(np.array((50.0, 50.0)), env).network
+    other.add_neuron(neurons.OutputNeuron(other, other.agent.move))
+    with pytest.raises(ValueError):
+        other.load_network(tmp_path / "net")
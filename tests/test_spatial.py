@@ -0,0 +1,30 @@
+import numpy as np
+
+from lib.spatial2d import SpatialGrid
+
+
+def pairs_within(a, b, distance):
+    d = np.linalg.norm(a[:, None] - b[None], axis=2)
+    return {(int(i), int(j)) for i, j in zip(*np.nonzero(d <= distance))}
+
+
+def test_candidate_pairs_contain_all_close_pairs():
+    rng = np.random.default_rng(0)
+    pos = rng.uniform(0, 300, (400, 2))
+    grid = SpatialGrid((300, 300))
+    grid.build(pos, 12)
+    i, j = grid.candidate_pairs()
+    found = {(min(a, b), max(a, b)) for a, b in zip(i.tolist(), j.tolist())}
+    assert len(found) == len(i)  # every pair once
+    close = {(a, b) for a, b in pairs_within(pos, pos, 12) if a < b}
+    assert close <= found
+
+
+def test_query_contains_all_points_in_reach():
+    rng = np.random.default_rng(1)
+    points = rng.uniform(0, 500, (300, 2))
+    queries = rng.uniform(0, 500, (50, 2))
+    grid = SpatialGrid((500, 500))
+    grid.build(points, 30)
+    q, p = grid.query(queries, 45)
+    assert pairs_within(queries, points, 45) <= set(zip(q.tolist(), p.tolist()))
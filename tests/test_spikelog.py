@@ -0,0 +1,60 @@
+import numpy as np
+
+from lib.env2d import Environment
+from lib.spikelog import SpikeLog, SpikeLogReader
+from test_networks import build, run
+
+
+def test_log_reads_back_across_segments(tmp_path):
+    rng = np.random.default_rng(0)
+    log = SpikeLog(tmp_path / "log", chunk_size=50)
+    rows = []
+    for tick in range(100):
+        n = rng.integers(0, 8)
+        agents, codes = rng.integers(0, 5, n), rng.integers(-3, 20, n)
+        log.append(tick, agents, codes)
+        rows += [(tick, a, c) for a, c in zip(agents.tolist(), codes.tolist())]
+    assert len(SpikeLogReader(tmp_path / "log")) == len(rows) - len(rows) % 50  # full segments
+    log.close()
+
+    reader = SpikeLogReader(tmp_path / "log")
+    assert len(reader) == len(log) == len(rows)
+    assert list(zip(*(reader.column(name).tolist() for name in ("tick", "agent", "neuron")))) \
+        == rows
+    ticks, agents, codes = reader.raster(agent=2, start=20, end=70)
+    expected = [row for row in rows if row[1] == 2 and 20 <= row[0] < 70]
+    assert list(zip(ticks.tolist(), agents.tolist(), codes.tolist())) == expected
+
+    # a log opened on an existing directory continues it
+    log = SpikeLog(tmp_path / "log", chunk_size=50)
+    log.append(100, 1, [4, 5])
+    log.close()
+    reader.refresh()
+    assert len(reader) == len(rows) + 2 and reader.raster(start=100)[2].tolist() == [4, 5]
+
+
+def test_environment_logs_every_spike(tmp_path):
+    env = Environment(2, autonomous_agents=4)
+    env.record_spikes(tmp_path / "log", chunk_size=64)
+    env.step(300)
+    env.stop_recording()
+    reader = SpikeLogReader(tmp_path / "log")
+    assert len(reader) == env.spike_count > 0
+    assert set(reader.column("agent").tolist()) <= {agent.id for agent in env.agents}
+
+
+def test_batched_and_single_networks_record_the_same_spikes(tmp_path):
+    recorded = []
+    for batched in (True, False):
+        env = build(batched, agents=6)
+        env.record_spikes(tmp_path / str(batched), chunk_size=64)
+        for agent in env.agents:
+            agent.network.spike_tracking = True
+        run(env, 200)
+        env.stop_recording()
+        rows = zip(*(SpikeLogReader(tmp_path / str(batched)).column(name).tolist()
+                     for name in ("tick", "agent", "neuron")))
+        rings = [sorted(zip(*(column.tolist() for column in agent.network.recording.read(0)[:2])))
+                 for agent in env.agents]
+        recorded.append((env.spike_count, sorted(rows), rings))
+    assert recorded[0][0] > 0 and recorded[0] == recorded[1]
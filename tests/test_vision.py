@@ -0,0 +1,62 @@
+import math
+
+import numpy as np
+
+from lib.env2d import Environment
+
+
+def nearest_hit(origin, angle, centers, radii, view_distance):
+    # distance along one ray to the nearest circle, one circle at a time
+    direction = np.array((math.cos(angle), math.sin(angle)))
+    best = np.inf
+    for center, radius in zip(centers, radii):
+        w = center - origin
+        along = w @ direction
+        inside = radius ** 2 - (w @ w - along ** 2)
+        if inside >= 0 and along >= 0:
+            hit = max(along - math.sqrt(inside), 0.0)
+            if hit <= view_distance:
+                best = min(best, hit)
+    return best
+
+
+def test_cast_matches_single_rays():
+    env = Environment(3, manual_agents=0, autonomous_agents=0, size=(400, 400), vision=True)
+    vision = env.vision
+    rng = np.random.default_rng(5)
+    origins = rng.uniform(0, 400, (20, 2))
+    angles = rng.uniform(-math.pi, math.pi, 20)
+    centers = rng.uniform(0, 400, (60, 2))
+    radii = rng.uniform(2, 15, 60)
+
+    headings = np.stack((np.cos(angles), np.sin(angles)), axis=1)
+    rays = angles[:, None] + vision.offsets()
+    directions = np.stack((np.cos(rays), np.sin(rays)), axis=2)
+    seer, target = np.divmod(np.arange(20 * 60), 60)
+    hits = vision.cast(origins, headings, directions, seer, centers[target], radii[target])
+
+    for s in range(20):
+        for r, offset in enumerate(vision.offsets()):
+            expected = nearest_hit(origins[s], angles[s] + offset, centers, radii,
+                                   vision.view_distance)
+            assert np.isclose(hits[s, r], expected) or hits[s, r] == expected == np.inf
+
+
+def test_vision_is_opt_in_and_not_counted():
+    blind = Environment(3, autonomous_agents=3)
+    assert blind.vision is None and blind.input_sources == (blind.random_inputs,)
+
+    env = Environment(3, manual_agents=0, autonomous_agents=3, vision=True)
+    env.max_food = 200
+    env.spawn_food(200)
+    for agent in env.agents:
+        # only vision neurons, every one of them driving an output
+        agent.network.clear()
+        env.vision.attach(agent.network)
+        assert all(agent.network.connectome.fanout(n.code).n == 1 for n in agent.network.inputs)
+    fired = []
+    fire = env.vision.fire
+    env.vision.fire = lambda clock: fired.append(fire(clock)) or fired[-1]
+    env.step(100)
+    assert sum(map(len, fired)) > 0
+    assert env.spike_count == 0